@@ -15,6 +15,7 @@ setup(
     author_email='ggallard@identicum.com',
     license='MIT License',
     install_requires=['requests'],
+    extras_require={'fast': ['orjson']},
     packages=['sherpa.midpoint'],
     zip_safe=False,
     python_requires='>=3.0'
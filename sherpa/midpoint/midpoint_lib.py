@@ -5,18 +5,41 @@
 #
 
 import base64
+import contextlib
+import copy
+import csv
+import gzip
+import hashlib
 import json
 import os
+import queue
 import requests
 from requests.auth import HTTPBasicAuth
 import shutil
+import sqlite3
+import sys
+import threading
 import time
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import ClassVar
+from requests.adapters import HTTPAdapter
 from importlib.metadata import version
 from sherpa.utils import validators
 from sherpa.utils import http
 from sherpa.utils.basics import Logger
 from sherpa.utils.basics import Properties
+from urllib.parse import urlencode
 from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 endpoints = {
     "AccessCertificationDefinitionType": "accessCertificationDefinitions",
@@ -108,6 +131,176 @@ def check_sherpa_oid(oid: str, object_class: str, expected_customer_id: str = "0
         raise ValueError("oid '{}' block D is '{}', expected '{}' for class '{}'.".format(oid, block_d, expected_block_d, object_class))
 
 
+def json_loads(data):
+    """Parse a JSON document (bytes or str) with orjson when it is installed, else with the json module."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps_bytes(value) -> bytes:
+    """Serialize value to UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode("utf-8")
+
+
+def as_list(value) -> list:
+    """Midpoint JSON collapses single-valued containers to a dict; always return a list."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def json_item_path(path: str) -> str:
+    """Drop the default 'c:' prefix from each segment of an XML-style item path, so it can be sent in JSON."""
+    return "/".join(segment.removeprefix("c:") for segment in path.split("/"))
+
+
+def build_item_delta(modification_type: str, path: str, value=None) -> dict:
+    """Build a single JSON itemDelta. A list value is sent as multiple values."""
+    item_delta = {
+        "modificationType": modification_type.lower(),
+        "path": json_item_path(path)
+    }
+    if value is not None:
+        item_delta["value"] = as_list(value)
+    return item_delta
+
+
+def build_object_modification(*item_deltas: dict) -> dict:
+    """Wrap one or more itemDeltas in a JSON objectModification body."""
+    return {"objectModification": {"itemDelta": list(item_deltas)}}
+
+
+def build_equal_query(path: str, value) -> dict:
+    """Build a JSON search query with a single equal filter."""
+    return {"query": {"filter": {"equal": {"path": json_item_path(path), "value": value}}}}
+
+
+def build_and_filter(*filters: dict) -> dict:
+    """Combine JSON filters with 'and'; filters of the same kind are grouped into a list, as midPoint expects."""
+    filters = [query_filter for query_filter in filters if query_filter]
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    combined = {}
+    for query_filter in filters:
+        for kind, clause in query_filter.items():
+            if kind in combined:
+                combined[kind] = as_list(combined[kind]) + [clause]
+            else:
+                combined[kind] = clause
+    return {"and": combined}
+
+
+def build_paging(offset: int = None, limit: int = None, order_by: str = None, order_direction: str = "ascending") -> dict:
+    """Build a JSON query paging element. order_by is a midPoint item path, e.g. 'name' or 'metadata/createTimestamp'."""
+    paging = {}
+    if offset is not None:
+        paging["offset"] = offset
+    if limit is not None:
+        paging["maxSize"] = limit
+    if order_by is not None:
+        paging["orderBy"] = json_item_path(order_by)
+        paging["orderDirection"] = order_direction
+    return paging
+
+
+API_TYPES_NS = "http://midpoint.evolveum.com/xml/ns/public/common/api-types-3"
+# item path of an object's oid, usable in filters and ordering
+OID_PATH = "#"
+# request bodies smaller than this are sent uncompressed, gzip would not pay off
+GZIP_MIN_SIZE = 1024
+MODIFY_TIMESTAMP_PATH = "metadata/modifyTimestamp"
+CREATE_TIMESTAMP_PATH = "metadata/createTimestamp"
+USER_EXPORT_COLUMNS = ["oid", "name", "givenName", "familyName", "fullName", "emailAddress", "title", "personalNumber", "metaPersonalEmail", "role_assignment", "role_membership"]
+TASK_SUCCESS_STATUSES = ["success", "warning", "handled_error", "not_applicable"]
+TASK_FAILURE_STATUSES = ["fatal_error", "partial_error"]
+# org items not needed to build the hierarchy
+ORG_TREE_EXCLUDE = ["assignment", "inducement", "authorization", "adminGuiConfiguration", "operationExecution"]
+# bulky case items left out of summary and count searches; oid, references and metadata are all they need
+CASE_SUMMARY_EXCLUDE = ["workItem", "event", "approvalContext", "modelContext", "outcome", "stageNumber", "trigger", "operationExecution"]
+# items left out of version-check searches, so they return little more than oid, name and version.
+# Only the types listed in VERSION_CHECK_EXCLUDE are kept in the object version caches: a version
+# check of any other type would transfer the whole object, so those are always fetched in full.
+_OBJECT_ITEMS = ["description", "documentation", "extension", "metadata", "operationExecution", "trigger", "parentOrgRef", "tenantRef", "lifecycleState", "policySituation", "policyException", "diagnosticInformation", "effectiveMarkRef", "subtype"]
+_ASSIGNMENT_HOLDER_ITEMS = _OBJECT_ITEMS + ["assignment", "archetypeRef", "roleMembershipRef", "delegatedRef", "roleInfluenceRef", "iteration", "iterationToken"]
+_FOCUS_ITEMS = _ASSIGNMENT_HOLDER_ITEMS + ["linkRef", "personaRef", "activation", "jpegPhoto", "costCenter", "locality", "behavior", "identities"]
+_ABSTRACT_ROLE_ITEMS = _FOCUS_ITEMS + ["displayName", "identifier", "inducement", "authorization", "adminGuiConfiguration", "requestable", "riskLevel", "approverRef", "approverExpression", "automaticallyApproved", "autoassign", "condition", "dataProtection", "delegable"]
+VERSION_CHECK_EXCLUDE = {
+    "ArchetypeType": _ABSTRACT_ROLE_ITEMS + ["archetypePolicy", "superArchetypeRef"],
+    "CaseType": _ASSIGNMENT_HOLDER_ITEMS + CASE_SUMMARY_EXCLUDE,
+    "OrgType": _ABSTRACT_ROLE_ITEMS + ["orgType", "tenant", "mailDomain", "displayOrder"],
+    "RoleType": _ABSTRACT_ROLE_ITEMS,
+    "ServiceType": _ABSTRACT_ROLE_ITEMS,
+    "SystemConfigurationType": _ASSIGNMENT_HOLDER_ITEMS + ["globalSecurityPolicyRef", "logging", "notificationConfiguration", "messagingConfiguration", "workflowConfiguration", "roleManagement", "internals", "adminGuiConfiguration", "deploymentInformation", "defaultObjectPolicyConfiguration", "cleanupPolicy", "profilingConfiguration", "accessCertification", "infrastructure", "fullTextSearch", "audit", "correlation", "secretsProviders"],
+    "TaskType": _ASSIGNMENT_HOLDER_ITEMS + ["activity", "activityState", "result", "affectedObjects", "schedule", "handlerUri"],
+    "UserType": _FOCUS_ITEMS + ["credentials", "fullName", "givenName", "familyName", "additionalName", "nickName", "honorificPrefix", "honorificSuffix", "title", "emailAddress", "telephoneNumber", "personalNumber", "organization", "organizationalUnit", "preferredLanguage", "locale", "timezone"],
+}
+
+
+def version_check_exclude(object_type: str) -> list[str]:
+    """Items to exclude from a search that only checks the version of object_type objects."""
+    return list(dict.fromkeys(VERSION_CHECK_EXCLUDE[object_type]))
+
+
+def is_version_cached(object_type: str) -> bool:
+    """Whether objects of object_type are kept in the version caches (see VERSION_CHECK_EXCLUDE)."""
+    return object_type in VERSION_CHECK_EXCLUDE
+
+
+def _local_name(tag: str) -> str:
+    return tag.split('}', 1)[1] if '}' in tag else tag
+
+
+def iter_xml_objects(source):
+    """
+    Yield each <object> of an XML search response read from a file-like source, one at a time.
+    An object is cleared (and dropped from the partial tree) as soon as the consumer asks for
+    the next one, so memory stays bounded by the largest single object.
+    """
+    depth = 0
+    root = None
+    for event, element in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1 and element.tag == "{" + API_TYPES_NS + "}object":
+            yield element
+            element.clear()
+            root.clear()
+
+
+def find_xml_fields(source, fields: list[str]) -> dict:
+    """
+    Pull targeted fields of the first object in an XML document (a search response or a single
+    object) read from a file-like source, without building the tree. 'oid' is read from the
+    object's attribute, any other field is the text of the first element with that local name
+    (e.g. 'name', 'resultStatus'). Parsing stops as soon as every field was found.
+    """
+    found = {}
+    wanted = set(fields)
+    for event, element in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if "oid" in wanted and "oid" not in found and "oid" in element.attrib:
+                found["oid"] = element.attrib["oid"]
+        else:
+            local_name = _local_name(element.tag)
+            if local_name in wanted and local_name not in found:
+                found[local_name] = element.text
+            element.clear()
+        if len(found) == len(wanted):
+            break
+    return found
+
+
 class MidpointError(Exception):
     """Raised when the Midpoint API returns an unexpected response."""
     def __init__(self, message, status_code=None):
@@ -115,21 +308,673 @@ class MidpointError(Exception):
         self.status_code = status_code
 
 
+class ObjectVersionCache:
+    """
+    Last known version and body of each object, keyed by (type, oid).
+    Entries checked less than revalidate_after seconds ago are served as-is; older
+    ones must be revalidated against the server's current version before use.
+    Bodies are copied in and out, so callers may modify what they get.
+    Callers only store types for which is_version_cached() is true.
+    """
+    def __init__(self, revalidate_after: float = 0, max_entries: int = 10000):
+        self.revalidate_after = revalidate_after
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"served": 0, "revalidated": 0, "fetched": 0}
+
+
+    def get_fresh(self, key):
+        """Return the cached body if it was checked within revalidate_after seconds, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry["checked_at"] >= self.revalidate_after:
+                return None
+            self._entries.move_to_end(key)
+            self._counters["served"] += 1
+            return copy.deepcopy(entry["body"])
+
+
+    def get_version(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry["version"]
+
+
+    def revalidated(self, key):
+        """Mark an entry as confirmed current by the server and return its body."""
+        with self._lock:
+            entry = self._entries[key]
+            entry["checked_at"] = time.monotonic()
+            self._entries.move_to_end(key)
+            self._counters["revalidated"] += 1
+            return copy.deepcopy(entry["body"])
+
+
+    def store(self, key, version, body):
+        with self._lock:
+            self._counters["fetched"] += 1
+            if version is None:
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = {"version": version, "body": copy.deepcopy(body), "checked_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+
+def _keyset_filter(query_filter: dict, after_oid: str) -> dict:
+    """query_filter restricted to objects after after_oid in oid order."""
+    if query_filter and "text" in query_filter:
+        # midPoint only takes an Axiom text filter as the whole filter, so the condition joins the query text
+        return {"text": f'({query_filter["text"]}) and {OID_PATH} > "{after_oid}"'}
+    return build_and_filter(query_filter, {"greater": {"path": OID_PATH, "value": after_oid}})
+
+
+def _is_default_relation(reference: dict) -> bool:
+    return reference.get("relation", "org:default").split(":")[-1] == "default"
+
+
+class OrgTree:
+    """
+    In-memory org hierarchy: the parents (default-relation parentOrgRef) and children of every
+    OrgType by oid, answering ancestor, descendant and subtree queries without requests.
+    Orgs may have several parents; traversals visit each org once, so cycles are harmless.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orgs = {}
+        self._children = {}
+        self.watermark = None
+        self.refreshed_at = None
+        self.full_refreshed_at = None
+
+
+    def _add(self, raw_org: dict):
+        parents = [reference["oid"] for reference in as_list(raw_org.get("parentOrgRef")) if _is_default_relation(reference)]
+        name = raw_org.get("name")
+        self._orgs[raw_org["oid"]] = {"oid": raw_org["oid"], "name": name.get("orig") if isinstance(name, dict) else name, "parents": parents}
+        for parent in parents:
+            self._children.setdefault(parent, set()).add(raw_org["oid"])
+
+
+    def _remove(self, oid: str):
+        org = self._orgs.pop(oid, None)
+        for parent in org["parents"] if org else []:
+            self._children.get(parent, set()).discard(oid)
+
+
+    def update(self, raw_orgs: list[dict]):
+        """Add or replace orgs, moving them in the hierarchy if their parents changed."""
+        with self._lock:
+            for raw_org in raw_orgs:
+                self._remove(raw_org["oid"])
+                self._add(raw_org)
+
+
+    def replace(self, raw_orgs: list[dict]):
+        """Rebuild the whole hierarchy from raw_orgs (orgs not in it are dropped)."""
+        with self._lock:
+            self._orgs = {}
+            self._children = {}
+            for raw_org in raw_orgs:
+                self._add(raw_org)
+
+
+    def get(self, oid: str) -> dict:
+        with self._lock:
+            org = self._orgs.get(oid)
+            return None if org is None else dict(org, parents=list(org["parents"]))
+
+
+    def _walk(self, start: list[str], neighbours) -> list[str]:
+        visited = set(start)
+        pending = deque(start)
+        found = []
+        while pending:
+            for oid in neighbours(pending.popleft()):
+                if oid not in visited:
+                    visited.add(oid)
+                    found.append(oid)
+                    pending.append(oid)
+        return found
+
+
+    def ancestors(self, oid: str) -> list[str]:
+        """Oids of every org above oid, nearest first."""
+        with self._lock:
+            return self._walk([oid], lambda current: self._orgs.get(current, {}).get("parents", []))
+
+
+    def descendants(self, oid: str) -> list[str]:
+        """Oids of every org below oid, nearest first."""
+        with self._lock:
+            return self._walk([oid], lambda current: sorted(self._children.get(current, ())))
+
+
+    def path(self, oid: str) -> list[dict]:
+        """{"oid", "name"} of each org from the root down to oid, following the first parent of each org."""
+        with self._lock:
+            path = []
+            visited = set()
+            while oid in self._orgs and oid not in visited:
+                visited.add(oid)
+                org = self._orgs[oid]
+                path.insert(0, {"oid": oid, "name": org["name"]})
+                oid = org["parents"][0] if org["parents"] else None
+            return path
+
+
+    def in_subtree(self, oids: list[str], root_oid: str) -> bool:
+        """Whether any of oids (e.g. a user's parent orgs) is root_oid or below it."""
+        with self._lock:
+            return any(oid == root_oid or root_oid in self._walk([oid], lambda current: self._orgs.get(current, {}).get("parents", [])) for oid in oids)
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"orgs": len(self._orgs), "watermark": self.watermark}
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs the call, callers
+    arriving while it is in flight wait and get a copy of its result (or its exception).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._counters = {"executed": 0, "coalesced": 0}
+
+
+    def do(self, key, call):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"done": threading.Event(), "result": None, "error": None}
+                self._flights[key] = flight
+                self._counters["executed"] += 1
+            else:
+                self._counters["coalesced"] += 1
+        if not leader:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return copy.deepcopy(flight["result"])
+        try:
+            flight["result"] = call()
+            return flight["result"]
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight["done"].set()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._flights))
+
+
+class ObjectSnapshotStore:
+    """
+    Persistent snapshot of selected object types in a SQLite file, indexed by (type, oid) and
+    (type, name). Every process opening the same path shares it, so restarted workers start warm.
+    max_age maps each covered object type to the seconds it is served before an incremental
+    refresh (objects changed since the last refresh). Deletions are only noticed by a full
+    refresh, done every full_refresh_after seconds.
+    """
+    def __init__(self, path: str, max_age: dict = None, full_refresh_after: float = 86400):
+        self.path = path
+        self.max_age = dict(max_age) if max_age is not None else {"RoleType": 300, "ArchetypeType": 300, "OrgType": 300}
+        self.full_refresh_after = full_refresh_after
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "refreshes": 0}
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS objects (type TEXT NOT NULL, oid TEXT NOT NULL, name TEXT, body TEXT NOT NULL, synced_at REAL NOT NULL, PRIMARY KEY (type, oid))")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS objects_name ON objects (type, name)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS refreshes (type TEXT PRIMARY KEY, watermark TEXT, refreshed_at REAL NOT NULL, full_refreshed_at REAL NOT NULL)")
+
+
+    def covers(self, object_type: str) -> bool:
+        return object_type in self.max_age
+
+
+    def _refresh_state(self, object_type: str):
+        with self._lock:
+            return self._connection.execute("SELECT watermark, refreshed_at, full_refreshed_at FROM refreshes WHERE type = ?", (object_type,)).fetchone()
+
+
+    def get_refresh(self, object_type: str) -> dict:
+        """None if object_type is fresh enough to serve, else {"since": watermark or None for a full refresh}."""
+        state = self._refresh_state(object_type)
+        now = time.time()
+        if state is None or now - state[2] >= self.full_refresh_after:
+            return {"since": None}
+        if now - state[1] >= self.max_age[object_type]:
+            return {"since": state[0]}
+        return None
+
+
+    def is_empty(self, object_type: str) -> bool:
+        return self._refresh_state(object_type) is None
+
+
+    def get_watermark(self, object_type: str) -> str:
+        state = self._refresh_state(object_type)
+        return None if state is None else state[0]
+
+
+    def store(self, object_type: str, raw_objects: list[dict], synced_at: float):
+        rows = []
+        for raw_object in raw_objects:
+            name = raw_object.get("name")
+            rows.append((object_type, raw_object["oid"], name.get("orig") if isinstance(name, dict) else name, json.dumps(raw_object), synced_at))
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO objects (type, oid, name, body, synced_at) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+    def mark_refreshed(self, object_type: str, watermark: str, started_at: float, full: bool):
+        """Record a completed refresh; a full one also drops the objects it did not see (deleted on the server)."""
+        with self._lock, self._connection:
+            self._counters["refreshes"] += 1
+            if full:
+                self._connection.execute("DELETE FROM objects WHERE type = ? AND synced_at < ?", (object_type, started_at))
+                self._connection.execute("INSERT OR REPLACE INTO refreshes (type, watermark, refreshed_at, full_refreshed_at) VALUES (?, ?, ?, ?)", (object_type, watermark, started_at, started_at))
+            else:
+                self._connection.execute("UPDATE refreshes SET watermark = ?, refreshed_at = ? WHERE type = ?", (watermark, started_at, object_type))
+
+
+    def _count(self, row) -> list[dict]:
+        self._counters["hits" if row else "misses"] += 1
+        return row
+
+
+    def get(self, object_type: str, object_oid: str) -> dict:
+        with self._lock:
+            row = self._count(self._connection.execute("SELECT body FROM objects WHERE type = ? AND oid = ?", (object_type, object_oid)).fetchone())
+        return json.loads(row[0]) if row else None
+
+
+    def get_all(self, object_type: str) -> list[dict]:
+        with self._lock:
+            rows = self._connection.execute("SELECT body FROM objects WHERE type = ?", (object_type,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+    def get_by_name(self, object_type: str, object_name: str) -> list[dict]:
+        with self._lock:
+            rows = self._count(self._connection.execute("SELECT body FROM objects WHERE type = ? AND name = ?", (object_type, object_name)).fetchall())
+        return [json.loads(row[0]) for row in rows]
+
+
+    def invalidate(self, object_type: str, object_oid: str):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM objects WHERE type = ? AND oid = ?", (object_type, object_oid))
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._connection.execute("SELECT type, COUNT(*) FROM objects GROUP BY type").fetchall()
+            return dict(self._counters, objects=dict(rows))
+
+
+@dataclass(frozen=True, slots=True)
+class PolyString:
+    orig: str
+    norm: str = None
+
+
+    def to_dict(self) -> dict:
+        if self.norm is None:
+            return {"orig": self.orig}
+        return {"orig": self.orig, "norm": self.norm}
+
+
+@dataclass(frozen=True, slots=True)
+class ObjectRef:
+    """A normalized reference ({type, oid, name, relation}); one instance is shared by every object pointing at the same target."""
+    type: str
+    oid: str
+    name: object
+    relation: str = None
+
+
+    def to_dict(self) -> dict:
+        reference = {"type": self.type, "oid": self.oid, "name": compact_to_value(self.name)}
+        if self.relation is not None:
+            reference["relation"] = self.relation
+        return reference
+
+
+@dataclass(slots=True)
+class CompactUser:
+    """Slotted form of a normalized user; to_dict() gives back the normalized_schema/user.json dict."""
+    oid: str = None
+    name: object = None
+    description: str = None
+    given_name: object = None
+    family_name: object = None
+    full_name: object = None
+    email_address: str = None
+    title: object = None
+    personal_number: str = None
+    meta_personal_email: str = None
+    role_assignment: tuple = ()
+    role_membership: tuple = ()
+    # attribute -> normalized key, in normalized output order
+    KEYS: ClassVar[dict] = {
+        "oid": "oid", "name": "name", "description": "description",
+        "given_name": "givenName", "family_name": "familyName", "full_name": "fullName",
+        "email_address": "emailAddress", "title": "title", "personal_number": "personalNumber",
+        "meta_personal_email": "metaPersonalEmail"
+    }
+
+
+    def to_dict(self) -> dict:
+        normalized_user = {"object_type": "User"}
+        for attribute, key in self.KEYS.items():
+            value = getattr(self, attribute)
+            if value is not None:
+                normalized_user[key] = compact_to_value(value)
+        normalized_user["role_assignment"] = [reference.to_dict() for reference in self.role_assignment]
+        normalized_user["role_membership"] = [reference.to_dict() for reference in self.role_membership]
+        return normalized_user
+
+
+def compact_to_value(value):
+    return value.to_dict() if isinstance(value, PolyString) else value
+
+
+def _is_poly_string(value) -> bool:
+    return isinstance(value, dict) and "orig" in value and set(value) <= {"orig", "norm"}
+
+
+class CompactInterner:
+    """
+    Builds compact objects from normalized dicts. References are interned: every user pointing at
+    the same (type, oid, relation) shares one ObjectRef, and repeated strings (types, relations,
+    reference names) are interned too.
+    """
+    def __init__(self):
+        self._references = {}
+        self._lock = threading.Lock()
+
+
+    def value(self, value):
+        """Compact a scalar or polyString value; a polyString dict with other keys than orig/norm is kept as-is."""
+        if isinstance(value, str):
+            return sys.intern(value)
+        if _is_poly_string(value):
+            return PolyString(sys.intern(value["orig"]), sys.intern(value["norm"]) if "norm" in value else None)
+        return value
+
+
+    def reference(self, reference: dict) -> ObjectRef:
+        key = (reference["type"], reference["oid"], reference.get("relation"))
+        name = self.value(reference.get("name"))
+        with self._lock:
+            object_ref = self._references.get(key)
+            if object_ref is None or object_ref.name != name:
+                object_ref = ObjectRef(sys.intern(key[0]), key[1], name, None if key[2] is None else sys.intern(key[2]))
+                self._references[key] = object_ref
+            return object_ref
+
+
+    def user(self, normalized_user: dict) -> CompactUser:
+        compact_user = CompactUser(
+            role_assignment=tuple(self.reference(reference) for reference in normalized_user.get("role_assignment", [])),
+            role_membership=tuple(self.reference(reference) for reference in normalized_user.get("role_membership", []))
+        )
+        for attribute, key in CompactUser.KEYS.items():
+            if key in normalized_user:
+                # user attributes are mostly unique: polyStrings are slotted, but not interned
+                value = normalized_user[key]
+                setattr(compact_user, attribute, PolyString(value["orig"], value.get("norm")) if _is_poly_string(value) else value)
+        return compact_user
+
+
+class NodeBalancer:
+    """
+    Picks the midPoint node (REST base URL) for each request. Reads go to the healthy node with
+    the fewest outstanding requests; writes go to the first healthy node. A node that fails
+    max_failures times in a row (connection error or 5xx) is ejected for ejection_time seconds.
+    """
+    def __init__(self, base_urls: list[str], max_failures: int = 3, ejection_time: float = 30, logger: Logger = None):
+        self.logger = logger if logger is not None else Logger("NodeBalancer")
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self._nodes = [{"base_url": base_url, "outstanding": 0, "failures": 0, "ejected_until": 0.0} for base_url in base_urls]
+        self._lock = threading.Lock()
+
+
+    def acquire(self, read: bool = True) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            # with every node ejected, keep trying all of them rather than failing outright
+            healthy = [node for node in self._nodes if node["ejected_until"] <= now] or self._nodes
+            node = min(healthy, key=lambda candidate: candidate["outstanding"]) if read else healthy[0]
+            node["outstanding"] += 1
+            return node
+
+
+    def release(self, node: dict, healthy: bool):
+        with self._lock:
+            node["outstanding"] -= 1
+            if healthy:
+                node["failures"] = 0
+                return
+            node["failures"] += 1
+            if node["failures"] >= self.max_failures:
+                node["ejected_until"] = time.monotonic() + self.ejection_time
+                self.logger.info(f"Ejecting node {node['base_url']} for {self.ejection_time}s after {node['failures']} failures")
+
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            now = time.monotonic()
+            return [{"base_url": node["base_url"], "outstanding": node["outstanding"], "failures": node["failures"], "ejected": node["ejected_until"] > now} for node in self._nodes]
+
+
+class AdmissionController:
+    """
+    Client-side admission control for midPoint requests, with "interactive" and "bulk" priority classes.
+    At most max_concurrency requests run at once, bulk ones at most bulk_concurrency, and a free slot
+    goes to waiting interactive requests first. rates optionally caps each class with a token bucket
+    ({priority: requests per second}, bursts of up to burst requests). With adaptive, a 503/429 or a
+    response slower than latency_target halves the bulk concurrency (and rate), which then grows back
+    one step per bulk_concurrency fast responses, so bulk work backs off while midPoint is saturated.
+    """
+    PRIORITIES: ClassVar[list[str]] = ["interactive", "bulk"]
+
+    def __init__(self, max_concurrency: int = 16, bulk_concurrency: int = 4, rates: dict = None, burst: int = 10, adaptive: bool = False, latency_target: float = 2.0, logger: Logger = None):
+        self.logger = logger if logger is not None else Logger("AdmissionController")
+        self.max_concurrency = max_concurrency
+        self.bulk_concurrency = min(bulk_concurrency, max_concurrency)
+        self.rates = dict(rates or {})
+        for priority, rate in self.rates.items():
+            if priority not in self.PRIORITIES:
+                raise MidpointError(f"Unknown priority: {priority}, expected one of {self.PRIORITIES}")
+            if rate is not None and rate <= 0:
+                raise MidpointError(f"Rate of {priority} requests must be positive, got {rate}")
+        if burst < 1:
+            raise MidpointError(f"Burst must be at least 1, got {burst}")
+        self.burst = burst
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self._condition = threading.Condition()
+        self._tokens = {priority: float(burst) for priority in self.PRIORITIES}
+        self._refilled_at = time.monotonic()
+        self._active = dict.fromkeys(self.PRIORITIES, 0)
+        self._waiting = dict.fromkeys(self.PRIORITIES, 0)
+        self._bulk_limit = float(self.bulk_concurrency)
+        self._backed_off_at = 0.0
+        self._counters = {"admitted": 0, "throttled": 0, "overloaded": 0}
+
+
+    def _rate(self, priority: str) -> float:
+        rate = self.rates.get(priority)
+        if rate is None or priority != "bulk":
+            return rate
+        return rate * self._bulk_limit / self.bulk_concurrency
+
+
+    def _refill(self):
+        now = time.monotonic()
+        for priority in self.PRIORITIES:
+            rate = self._rate(priority)
+            if rate is not None:
+                self._tokens[priority] = min(float(self.burst), self._tokens[priority] + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+
+    def _has_slot(self, priority: str) -> bool:
+        if sum(self._active.values()) >= self.max_concurrency:
+            return False
+        if priority == "bulk":
+            return self._active["bulk"] < int(self._bulk_limit) and self._waiting["interactive"] == 0
+        return True
+
+
+    def acquire(self, priority: str = "interactive"):
+        """Block until a request of priority may be sent; pair every call with release()."""
+        if priority not in self.PRIORITIES:
+            raise MidpointError(f"Unknown priority: {priority}, expected one of {self.PRIORITIES}")
+        with self._condition:
+            self._waiting[priority] += 1
+            throttled = False
+            try:
+                while True:
+                    self._refill()
+                    timeout = None
+                    if self._has_slot(priority):
+                        rate = self._rate(priority)
+                        if rate is None or self._tokens[priority] >= 1:
+                            if rate is not None:
+                                self._tokens[priority] -= 1
+                            self._active[priority] += 1
+                            self._counters["admitted"] += 1
+                            self._counters["throttled"] += 1 if throttled else 0
+                            return
+                        timeout = (1 - self._tokens[priority]) / rate
+                    throttled = True
+                    self._condition.wait(timeout=timeout)
+            finally:
+                self._waiting[priority] -= 1
+
+
+    def release(self, priority: str, latency: float, status_code: int = None):
+        """Free the slot taken by acquire(); status_code None means the request failed without a response."""
+        with self._condition:
+            self._active[priority] -= 1
+            if self.adaptive:
+                self._adapt(latency, status_code)
+            self._condition.notify_all()
+
+
+    def _adapt(self, latency: float, status_code: int):
+        now = time.monotonic()
+        if status_code in [429, 503] or latency > self.latency_target:
+            self._counters["overloaded"] += 1
+            # one back-off per latency_target, so a burst of slow responses doesn't collapse the limit at once
+            if now - self._backed_off_at >= self.latency_target and self._bulk_limit > 1:
+                self._bulk_limit = max(1.0, self._bulk_limit / 2)
+                self._backed_off_at = now
+                self.logger.info(f"midPoint overloaded (status={status_code}, latency={latency:.2f}s), bulk concurrency reduced to {int(self._bulk_limit)}")
+        elif self._bulk_limit < self.bulk_concurrency:
+            self._bulk_limit = min(float(self.bulk_concurrency), self._bulk_limit + 1 / self.bulk_concurrency)
+
+
+    @contextlib.contextmanager
+    def admit(self, priority: str = "interactive"):
+        """
+        Context manager around one request: acquire on entry, release with the measured latency on exit.
+        Set the "status_code" item of the yielded dict so adaptive mode can see 503/429 responses.
+        """
+        self.acquire(priority)
+        with self.held(priority) as outcome:
+            yield outcome
+
+
+    @contextlib.contextmanager
+    def held(self, priority: str = "interactive"):
+        """Like admit, for a slot already taken with acquire(), so the wait for it can be timed on its own."""
+        outcome = {"status_code": None}
+        start = time.monotonic()
+        try:
+            yield outcome
+        finally:
+            self.release(priority, time.monotonic() - start, outcome["status_code"])
+
+
+    def stats(self) -> dict:
+        with self._condition:
+            return dict(self._counters, active=dict(self._active), waiting=dict(self._waiting), bulk_limit=int(self._bulk_limit))
+
+
 class MidpointClient:
-    def __init__(self, mp_baseurl: str, mp_username: str, mp_password: str, on_behalf: str = None, logger: Logger = None, timeout: int = 10, iterations: int = 10, interval: int = 10):
+    def __init__(self, mp_baseurl: str, mp_username: str, mp_password: str, on_behalf: str = None, logger: Logger = None, timeout: int = 10, iterations: int = 10, interval: int = 10, max_concurrency: int = 8, revalidate_after: float = 0, session: requests.Session = None, balancer: "NodeBalancer" = None, snapshot: "ObjectSnapshotStore" = None, compress_requests: bool = False, single_flight: bool = True, admission: "AdmissionController" = None, priority: str = "interactive", max_principal_caches: int = 16, org_tree_refresh_after: float = 300, org_tree_full_refresh_after: float = 86400):
         self.logger = logger if logger is not None else Logger("MidpointClient")
-        self.logger.debug(f"Midpoint lib version: {version("sherpa-py-midpoint")}")
+        self.logger.debug("Midpoint lib version: {}", version("sherpa-py-midpoint"))
         self.base_url = mp_baseurl + "/ws/rest"
         self.timeout = timeout
+        # gzip request bodies; midPoint (or its proxy) must be set up to decompress them
+        self.compress_requests = compress_requests
         self.auth = HTTPBasicAuth(mp_username, mp_password)
-        self.session = requests.Session()
-        self.session.auth = self.auth
+        if session is None:
+            session = requests.Session()
+            # one connection per concurrent call, so fan-out never waits for a pooled connection
+            adapter = HTTPAdapter(pool_maxsize=max_concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self._balancer = balancer if balancer is not None else NodeBalancer([self.base_url])
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="MidpointClient")
+        self._fan_out_state = threading.local()
+        self._revalidate_after = revalidate_after
+        self._object_cache = ObjectVersionCache(revalidate_after=revalidate_after)
+        self._own_object_cache = self._object_cache
+        # objects are cached per principal, as each one may be authorized to read different items;
+        # only the max_principal_caches most recently used principals besides the client's own are kept
+        self._max_principal_caches = max_principal_caches
+        self._principal_caches = OrderedDict()
+        self._principal_caches_lock = threading.Lock()
+        self._principal = on_behalf
+        self._interner = CompactInterner()
+        # the snapshot holds what the client's own principal can read, so views on behalf of others skip it
+        self._snapshot = snapshot
+        self._snapshot_principal = on_behalf
+        self._snapshot_lock = threading.Lock()
+        # identical read requests in flight at the same time are sent once
+        self._single_flight = SingleFlight() if single_flight else None
+        self._admission = admission
+        self._priority = priority
+        # org hierarchy as the client's own principal reads it, shared by its views; loaded on first use,
+        # refreshed incrementally after org_tree_refresh_after seconds and reloaded after org_tree_full_refresh_after
+        self._org_tree_refresh_after = org_tree_refresh_after
+        self._org_tree_full_refresh_after = org_tree_full_refresh_after
+        self._org_tree = OrgTree()
+        self._org_tree_lock = threading.Lock()
         self.session.headers.update({
             "Content-Type": "application/json",
-            "Accept": "application/json"
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate"
         })
-        if on_behalf is not None:
-            self.session.headers["Switch-To-Principal"] = on_behalf
 
 
         mp_credentials = f"{mp_username}:{mp_password}"
@@ -145,232 +990,276 @@ class MidpointClient:
         raise AttributeError("Can't find REST type for class " + object_type)
 
 
-    def _http_get(self, path: str, params: dict = None, expected_status: list[int] = [200]) -> dict:
-        url = self.base_url + path
-        self.logger.debug(f"GET {url} params={params}")
-        resp = self.session.get(url, params=params, timeout=self.timeout)
-        self.logger.trace(f"GET {url} -> status={resp.status_code} body={resp.text}")
+    def for_principal(self, on_behalf: str) -> "MidpointClient":
+        """
+        A view of this client that acts on behalf of another principal (None for the client's own user).
+        It shares the connection pool, node balancer, fan-out executor and per-principal object cache,
+        so it is cheap to create per call: no new session and no readiness probe. Caches of principals
+        other than the client's own are kept for the max_principal_caches most recently used ones
+        (0 gives every view a cache of its own).
+        """
+        view = copy.copy(self)
+        view._principal = on_behalf
+        view._object_cache = self._principal_cache(on_behalf)
+        return view
+
+
+    def _principal_cache(self, on_behalf: str) -> ObjectVersionCache:
+        if on_behalf == self._snapshot_principal:
+            return self._own_object_cache
+        if self._max_principal_caches <= 0:
+            return ObjectVersionCache(revalidate_after=self._revalidate_after)
+        with self._principal_caches_lock:
+            cache = self._principal_caches.get(on_behalf)
+            if cache is None:
+                cache = self._principal_caches[on_behalf] = ObjectVersionCache(revalidate_after=self._revalidate_after)
+                while len(self._principal_caches) > self._max_principal_caches:
+                    self._principal_caches.popitem(last=False)
+            self._principal_caches.move_to_end(on_behalf)
+            return cache
+
+
+    def with_priority(self, priority: str) -> "MidpointClient":
+        """
+        A view of this client whose requests are admitted with another AdmissionController priority,
+        e.g. client.with_priority("bulk") for mass role requests or exports. Shares everything else.
+        """
+        view = copy.copy(self)
+        view._priority = priority
+        return view
+
+
+    def _send(self, method: str, path: str, read: bool, headers: dict = None, **kwargs) -> requests.Response:
+        """Send a request, once the admission controller (if any) lets it through for this view's priority."""
+        if self._admission is None:
+            return self._send_to_node(method, path, read, headers, **kwargs)
+        with self._admission.admit(self._priority) as outcome:
+            resp = self._send_to_node(method, path, read, headers, **kwargs)
+            outcome["status_code"] = resp.status_code
+            return resp
+
+
+    def _send_to_node(self, method: str, path: str, read: bool, headers: dict, **kwargs) -> requests.Response:
+        """Send a request to the node picked by the balancer, reporting the node's health back to it."""
+        node = self._balancer.acquire(read=read)
+        healthy = False
+        try:
+            # a None value drops the header, so a view without principal never inherits one
+            resp = self.session.request(method, node["base_url"] + path, auth=self.auth, headers=dict({"Switch-To-Principal": self._principal}, **(headers or {})), timeout=self.timeout, **kwargs)
+            healthy = resp.status_code < 500
+            return resp
+        finally:
+            self._balancer.release(node, healthy)
+
+
+    def _http_call(self, method: str, path: str, read: bool, expected_status: list[int], body: dict = None, params: dict = None) -> dict:
+        """
+        Send body as JSON (gzip-compressed when compress_requests is set and it is large enough)
+        and return the response body, decoded once with json_loads ({} when empty).
+        """
+        data = None if body is None else json_dumps_bytes(body)
+        if not read or self._single_flight is None:
+            return self._http_exchange(method, path, read, expected_status, data, params)
+        # concurrent identical reads (same principal, method, path, params and body) share one request
+        key = (self._principal, method, path, json.dumps(params, sort_keys=True), None if data is None else hashlib.sha256(data).hexdigest(), tuple(expected_status))
+        return self._single_flight.do(key, lambda: self._http_exchange(method, path, read, expected_status, data, params))
+
+
+    def _http_exchange(self, method: str, path: str, read: bool, expected_status: list[int], data: bytes, params: dict) -> dict:
+        headers = None
+        if data is not None and self.compress_requests and len(data) >= GZIP_MIN_SIZE:
+            data = gzip.compress(data, compresslevel=5)
+            headers = {"Content-Encoding": "gzip"}
+        resp = self._send(method, path, read=read, headers=headers, data=data, params=params)
+        content = resp.content
         if resp.status_code not in expected_status:
+            self.logger.trace("{} {} -> status={} body={}", method, resp.url, resp.status_code, content)
             validators.raise_and_log(self.logger, IOError, f"Invalid HTTP response received: '{resp.status_code}'.")
-        return resp.json()
+        json_resp = json_loads(content) if content else {}
+        self.logger.trace("{} {} -> status={} body={}", method, resp.url, resp.status_code, json_resp)
+        return json_resp
+
+
+    def _http_get(self, path: str, params: dict = None, expected_status: list[int] = [200]) -> dict:
+        self.logger.debug("GET {} params={}", path, params)
+        return self._http_call("GET", path, read=True, expected_status=expected_status, params=params)
 
 
     def _http_patch(self, path: str, body: dict = None, expected_status: list[int] = [200]) -> dict:
-        url = self.base_url + path
-        self.logger.debug(f"PATCH {url} body={body}")
-        resp = self.session.patch(url, json=body, timeout=self.timeout)
-        self.logger.trace(f"PATCH {url} -> status={resp.status_code} body={resp.text}")
-        if resp.status_code not in expected_status:
-            validators.raise_and_log(self.logger, IOError, f"Invalid HTTP response received: '{resp.status_code}'.")
-        if not resp.text:
-            return {}
-        return resp.json()
+        self.logger.debug("PATCH {} body={}", path, body)
+        return self._http_call("PATCH", path, read=False, expected_status=expected_status, body=body)
 
 
-    def _http_post(self, path: str, body: dict = None, expected_status: list[int] = [200]) -> dict:
-        url = self.base_url + path
-        self.logger.debug(f"POST {url}, body={body}, headers={self.session.headers}")
-        resp = self.session.post(url, json=body, timeout=self.timeout)
-        self.logger.trace(f"POST {url} -> status={resp.status_code} body={resp.text}")
-        if resp.status_code not in expected_status:
-            validators.raise_and_log(self.logger, IOError, f"Invalid HTTP response received: '{resp.status_code}'.")
-        if not resp.text:
-            return {}
-        return resp.json()
+    def _http_post(self, path: str, body: dict = None, expected_status: list[int] = [200], read: bool = False, params: dict = None) -> dict:
+        self.logger.debug("POST {}, body={}, params={}, on_behalf={}", path, body, params, self._principal)
+        return self._http_call("POST", path, read=read, expected_status=expected_status, body=body, params=params)
 
 
-    def _extract_display_name(self, ref_or_poly) -> str:
-        """Extract a human-readable name from a Midpoint polyString or objectRef."""
-        self.logger.debug("Starting")
-        if not ref_or_poly:
-            return ""
-        if isinstance(ref_or_poly, str):
-            return ref_or_poly
-        if isinstance(ref_or_poly, dict):
-            return (
-                ref_or_poly.get("orig")
-                or ref_or_poly.get("targetName", {}).get("orig", "")
-                or ref_or_poly.get("name", {}).get("orig", "")
-                or ""
-            )
-        return ""
+    def _run_in_worker(self, call):
+        self._fan_out_state.in_worker = True
+        try:
+            return call()
+        finally:
+            self._fan_out_state.in_worker = False
 
 
-    def _normalize_object_reference(self, reference: dict, allowed_type: str = "*") -> list[dict]:
-        self.logger.trace(f"Starting, reference: {reference}. Allowed type: {allowed_type}")
-        normalized_reference = {}
-        reference_type = reference["type"].removeprefix("c:")
-        reference_oid = reference["oid"]
-        self.logger.trace(f"Reference({reference_type}): {reference_oid}")
-        if allowed_type == "*" or reference_type == allowed_type:
-            self.logger.trace("Processing reference.")
-            normalized_reference["type"] = reference_type.removesuffix("Type")
-            reference_object = self._get_object(object_type=reference_type, object_oid=reference_oid)
-            normalized_reference["oid"] = reference_oid
-            normalized_reference["name"] = reference_object["name"]
-            if "relation" in reference:
-                normalized_reference["relation"] = reference["relation"]
-        self.logger.trace(f"Returning normalized reference: {normalized_reference}")
-        return normalized_reference
-
-
-    def _normalize_object_references(self, references, allowed_type: str = "*") -> list[dict]:
-        normalized_references = []
-        if isinstance(references, dict):
-            references = [references]
-        self.logger.trace(f"Processing {len(references)} reference/s. Type: {allowed_type}")
-        for reference in references:
-            normalized_reference = self._normalize_object_reference(reference=reference, allowed_type=allowed_type)
-            if normalized_reference:
-                normalized_references.append(normalized_reference)
-        self.logger.trace(f"Returning normalized references: {normalized_references}")
-        return normalized_references
-
-
-    def _normalize_assignments(self, assignments, allowed_type: str = "*", allowed_status: str = "*") -> list[dict]:
-        self.logger.trace(f"Processing assignments: {assignments}")
-        normalized_assignments = []
-        if isinstance(assignments, dict):
-            assignments = [assignments]
-        for assignment in assignments:
-            normalized_assignment = {}
-            targetRef = assignment["targetRef"]
-            target_type = targetRef["type"].removeprefix("c:")
-            assignment_status = assignment.get("activation").get("effectiveStatus")
-            if allowed_type in ["*", target_type] and allowed_status in ["*", assignment_status]:
-                normalized_assignment["type"] = target_type.removesuffix("Type")
-                target_oid = targetRef["oid"]
-                target_object = self._get_object(object_type=target_type, object_oid=target_oid)
-                normalized_assignment["oid"] = target_oid
-                normalized_assignment["relation"] = targetRef["relation"]
-                normalized_assignment["name"] = target_object["name"]
-                normalized_assignments.append(normalized_assignment)
-        return normalized_assignments
-
-
-    def _normalize_case_workitem(self, workitem: dict) -> dict:
-        self.logger.trace("workitem: {}", workitem)
-        normalized_workitem = {}
-        normalized_workitem["id"] = workitem["@id"]
-        normalized_workitem["name"] = workitem["name"]["orig"]
-        normalized_workitem["assignee"] = self._normalize_object_reference(workitem["assigneeRef"])
-        return normalized_workitem
-
-
-    def _normalize_case_workitems(self, workitems) -> dict:
-        normalized_workitems = []
-        if isinstance(workitems, dict):
-            workitems = [workitems]
-        self.logger.trace(f"Processing {len(workitems)} workitem/s")
-        for workitem in workitems:
-            normalized_workitems.append(self._normalize_case_workitem(workitem))
-        return normalized_workitems
-
-
-    def _normalize_object(self, raw_object: dict) -> dict:
-        self.logger.trace(f"Processing object: {raw_object}")
-        normalized_object = {}
-        object_type = ""
-
-        if "@type" in raw_object:
-            object_type = raw_object["@type"].removeprefix("c:").removesuffix("Type")
-            normalized_object["object_type"]=object_type
-
-        for attr in ["oid", "name", "description"]:
-            if attr in raw_object:
-                normalized_object[attr]=raw_object[attr]
-
-        match object_type:
-            case "Case":
-                for attr in ["state"]:
-                    if attr in raw_object:
-                        normalized_object[attr]=raw_object[attr]
-                normalized_object["create_timestamp"]=raw_object.get("@metadata", {}).get("storage", {}).get("createTimestamp")
-                for reference in ["object", "target", "requestor"]:
-                    reference_key = f"{reference}Ref"
-                    if reference_key in raw_object:
-                        self.logger.debug(f"Normalizing reference: {reference_key}")
-                        normalized_object[reference] = self._normalize_object_reference(raw_object[reference_key])
-                if "workItem" in raw_object:
-                    normalized_object["workitems"] = self._normalize_case_workitems(raw_object["workItem"])
-                else:
-                    # discard parent "empty" case
-                    return {}
-                # override name
-                name_orig = normalized_object["name"]["orig"]
-                normalized_object["name"] = name_orig
-            case "Role":
-                for attr in ["requestable"]:
-                    if attr in raw_object:
-                        normalized_object[attr]=raw_object[attr]
-            case "User":
-                for attr in ["givenName", "familyName", "fullName", "emailAddress", "title", "personalNumber"]:
-                    if attr in raw_object:
-                        normalized_object[attr]=raw_object[attr]
-                if "extension" in raw_object:
-                    extension = raw_object["extension"]
-                    for ext_attr in ["metaPersonalEmail"]:
-                        normalized_object[ext_attr] = extension[ext_attr]
-                normalized_object["role_assignment"] = self._normalize_assignments(raw_object.get("assignment", []), "RoleType", "enabled")
-                normalized_object["role_membership"] = self._normalize_object_references(raw_object.get("roleMembershipRef", []), "RoleType")
-        return normalized_object
+    def _fan_out(self, calls: list) -> list:
+        """
+        Run independent zero-argument calls concurrently (at most max_concurrency at once)
+        and return their results in order. A fan-out started from a worker runs inline,
+        so nested fan-outs can't exhaust the pool and deadlock.
+        """
+        if len(calls) <= 1 or getattr(self._fan_out_state, "in_worker", False):
+            return [call() for call in calls]
+        futures = [self._executor.submit(self._run_in_worker, call) for call in calls]
+        return [future.result() for future in futures]
+
+
+    def _resolve_references(self, references: list[dict]) -> dict:
+        """Fetch the distinct objects behind references concurrently. Returns {(object_type, oid): object}."""
+        keys = list(dict.fromkeys((reference["type"].removeprefix("c:"), reference["oid"]) for reference in references))
+        self.logger.debug("Resolving {} distinct reference/s", len(keys))
+        return self._get_objects_by_key(keys)
+
+
+    def _normalize_object(self, raw_object: dict, resolved: dict = None) -> dict:
+        """normalize_object, resolving the object's references first unless resolved is given."""
+        if resolved is None:
+            resolved = self._resolve_references(collect_references(raw_object))
+        return normalize_object(raw_object, resolved)
 
 
     def _normalize_objects(self, raw_objects: list[dict]) -> list[dict]:
-        self.logger.debug(f"Processing {len(raw_objects)} objects")
-        normalized_objects = []
-        for raw_object in raw_objects:
-            normalized_object = self._normalize_object(raw_object)
-            # discard empty objects
-            if normalized_object:
-                normalized_objects.append(normalized_object)
-        return normalized_objects
+        self.logger.debug("Processing {} objects", len(raw_objects))
+        # resolve every reference of the page in one concurrent round instead of one request per reference
+        resolved = self._resolve_references([reference for raw_object in raw_objects for reference in collect_references(raw_object)])
+        return normalize_objects(raw_objects, resolved)
 
 
-    def _search_objects(self, object_type: str, query_payload: dict) -> list[dict]:
-        self.logger.debug(f"Starting: object_type={object_type}, query_payload={query_payload}")
-        json_resp = self._http_post(path=self._get_endpoint(object_type) + "/search", body=query_payload)
-        self.logger.trace(f"json_resp: {json_resp}")
+    def _search_objects(self, object_type: str, query_payload: dict, exclude: list[str] = None, options: list[str] = None) -> list[dict]:
+        """
+        Search objects; exclude lists item paths the server leaves out of the results, options are
+        midPoint get operation options such as "noFetch" or "raw".
+        """
+        self.logger.debug("Starting: object_type={}, query_payload={}, exclude={}, options={}", object_type, query_payload, exclude, options)
+        params = {name: value for name, value in [("exclude", exclude), ("options", options)] if value} or None
+        json_resp = self._http_post(path=self._get_endpoint(object_type) + "/search", body=query_payload, read=True, params=params)
+        self.logger.trace("json_resp: {}", json_resp)
         objects = json_resp.get("object", {}).get("object", [])
         if isinstance(objects, dict):
             objects = [objects]
         if not objects:
             self.logger.info(f"Object not found: type={object_type}, query_payload={query_payload}")
             return []
-        self.logger.trace(f"Returning {len(objects)} objects: {objects}")
+        self.logger.trace("Returning {} objects: {}", len(objects), objects)
         return objects
 
 
     def _search_object_by_name(self, object_type: str, object_name: str) -> dict:
-        self.logger.debug(f"Starting: object_type={object_type}, object_name={object_name}")
-        query_payload = {"query": {"filter": {"equal": {"path": "name", "value": object_name}}}}
+        self.logger.debug("Starting: object_type={}, object_name={}", object_type, object_name)
+        snapshot = self._snapshot_for(object_type)
+        if snapshot is not None:
+            objects = snapshot.get_by_name(object_type, object_name)
+            if len(objects) > 1:
+                raise MidpointError(f"Multiple objects found for type={object_type}, name={object_name}")
+            if objects:
+                return objects[0]
+        query_payload = build_equal_query("name", object_name)
         objects = self._search_objects(object_type, query_payload)
-        self.logger.trace(f"objects: {objects}")
+        self.logger.trace("objects: {}", objects)
         if not objects:
             self.logger.info(f"Object not found: type={object_type}, name={object_name}")
             return {}
         if len(objects) > 1:
             raise MidpointError(f"Multiple objects found for type={object_type}, name={object_name}")
-        self.logger.trace(f"objects[0]: {objects[0]}")
+        self.logger.trace("objects[0]: {}", objects[0])
         return objects[0]
 
 
-    def _get_object(self, object_type: str, object_oid: str) -> dict:
-        self.logger.debug(f"Starting: object_type={object_type}, object_oid={object_oid}")
+    def _fetch_object(self, object_type: str, object_oid: str) -> dict:
         json_resp = self._http_get(path=self._get_endpoint(object_type) + "/" + object_oid)
         obj = next(iter(json_resp.values()), None)
-        self.logger.trace(f"obj: {obj}")
+        self.logger.trace("obj: {}", obj)
         if not obj:
             self.logger.info(f"Object not found: type={object_type}, name={object_oid}")
             return None
+        if is_version_cached(object_type):
+            self._object_cache.store((object_type, object_oid), obj.get("version"), obj)
         return obj
 
 
+    def _revalidate_objects(self, object_type: str, object_oids: list[str]) -> dict:
+        """
+        Check cached objects against the server's current version with a single inOid search,
+        projected down to (little more than) oid and version. Unchanged objects are served from
+        the cache; changed ones are fetched again, concurrently. Returns {(object_type, oid): object}
+        for the objects that still exist.
+        """
+        self.logger.debug("Revalidating {} {} object/s", len(object_oids), object_type)
+        query_payload = {"query": {"filter": {"inOid": {"value": object_oids}}}}
+        objects = {}
+        changed = []
+        for obj in self._search_objects(object_type, query_payload, exclude=version_check_exclude(object_type)):
+            key = (object_type, obj["oid"])
+            if obj.get("version") is not None and obj["version"] == self._object_cache.get_version(key):
+                objects[key] = self._object_cache.revalidated(key)
+            else:
+                changed.append(key)
+        for result in self._fan_out([lambda key=key: {key: self._fetch_object(*key)} for key in changed]):
+            objects.update(result)
+        return objects
+
+
+    def _get_objects_by_key(self, keys: list[tuple]) -> dict:
+        """
+        Get objects by (object_type, oid). Objects in the snapshot store and fresh cached objects
+        cost nothing, stale ones are revalidated with one search per type, and unknown ones are
+        fetched; all requests run concurrently. Returns {(object_type, oid): object}.
+        """
+        objects = {}
+        stale = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            snapshot = self._snapshot_for(key[0])
+            body = snapshot.get(*key) if snapshot is not None else None
+            if body is None:
+                body = self._object_cache.get_fresh(key)
+            if body is not None:
+                objects[key] = body
+            elif self._object_cache.get_version(key) is not None:
+                stale.setdefault(key[0], []).append(key[1])
+            else:
+                missing.append(key)
+        calls = [lambda object_type=object_type, object_oids=object_oids: self._revalidate_objects(object_type, object_oids) for object_type, object_oids in stale.items()]
+        calls += [lambda key=key: {key: self._fetch_object(*key)} for key in missing]
+        for result in self._fan_out(calls):
+            objects.update(result)
+        # cached objects not returned by the revalidation search: fetch them, so the usual not-found handling applies
+        gone = [(object_type, oid) for object_type, object_oids in stale.items() for oid in object_oids if (object_type, oid) not in objects]
+        for key in gone:
+            self._invalidate_object(*key)
+        for result in self._fan_out([lambda key=key: {key: self._fetch_object(*key)} for key in gone]):
+            objects.update(result)
+        return objects
+
+
+    def _invalidate_object(self, object_type: str, object_oid: str):
+        """Drop an object this client changed or found gone from the object cache and the snapshot store."""
+        self._object_cache.invalidate((object_type, object_oid))
+        if self._snapshot is not None and self._snapshot.covers(object_type):
+            self._snapshot.invalidate(object_type, object_oid)
+
+
+    def _get_object(self, object_type: str, object_oid: str) -> dict:
+        self.logger.debug("Starting: object_type={}, object_oid={}", object_type, object_oid)
+        return self._get_objects_by_key([(object_type, object_oid)])[(object_type, object_oid)]
+
+
     def _get_objects(self, object_type: str) -> list[dict]:
-        self.logger.debug(f"Starting: object_type={object_type}")
+        self.logger.debug("Starting: object_type={}", object_type)
         json_resp = self._http_get(path=self._get_endpoint(object_type))
         objects = json_resp.get("object", {}).get("object", [])
-        self.logger.trace(f"objects: {objects}")
+        self.logger.trace("objects: {}", objects)
         if isinstance(objects, dict):
             objects = [objects]
 
@@ -378,8 +1267,30 @@ class MidpointClient:
     # ###############################################################################
     # General
 
+    def get_metrics(self) -> dict:
+        """
+        object_cache: served (fresh, no request), revalidated (version unchanged on the server)
+        and fetched (transferred in full) object lookups.
+        nodes: outstanding requests, consecutive failures and ejection of each node.
+        """
+        metrics = {"object_cache": self._object_cache.stats(), "nodes": self._balancer.stats()}
+        if self._single_flight is not None:
+            # single_flight: read requests sent (executed), answered by one already in flight (coalesced), and in flight now
+            metrics["single_flight"] = self._single_flight.stats()
+        if self._org_tree.refreshed_at is not None:
+            # org_tree: orgs in the hierarchy and the change watermark of its last refresh
+            metrics["org_tree"] = self._org_tree.stats()
+        if self._admission is not None:
+            # admission: admitted and throttled (had to wait) requests, overload signals, current load and bulk limit
+            metrics["admission"] = self._admission.stats()
+        if self._snapshot is not None:
+            # snapshot: hits and misses of snapshot lookups, refreshes and stored objects per type
+            metrics["snapshot"] = self._snapshot.stats()
+        return metrics
+
+
     def get_object_oid(self, object_type: str, object_name: str) -> str:
-        self.logger.debug(f"Starting: object_type={object_type}, object_name={object_name}")
+        self.logger.debug("Starting: object_type={}, object_name={}", object_type, object_name)
         object = self._search_object_by_name(object_type, object_name)
         if "oid" in object:
             return object["oid"]
@@ -390,37 +1301,124 @@ class MidpointClient:
     # ###############################################################################
     # Case
 
-    def get_requested_cases(self, requestor_oid: str) -> list[dict]:
-        self.logger.debug(f"Starting: requestor_oid={requestor_oid}")
-        query_payload = {
-            "query": {
-                "filter": {
-                    "text": f'state = "open" and requestorRef matches (oid = "{requestor_oid}")'
-                }
-            }
-        }
+    def _requested_cases_filter(self, requestor_oid: str) -> dict:
+        # parent cases (without work items) are left out on the server, so paging and counts see the same cases
+        return {"text": f'state = "open" and requestorRef matches (oid = "{requestor_oid}") and workItem exists'}
+
+
+    def _assigned_cases_filter(self, assignee_oid: str) -> dict:
+        return {"text": f'state = "open" and workItem/assigneeRef matches (oid = "{assignee_oid}")'}
+
+
+    def _search_cases(self, query_filter: dict, offset: int = None, limit: int = None, order_by: str = None, order_direction: str = "ascending") -> list[dict]:
+        query_payload = {"query": {"filter": query_filter}}
+        paging = build_paging(offset=offset, limit=limit, order_by=order_by, order_direction=order_direction)
+        if paging:
+            query_payload["query"]["paging"] = paging
         case_objects = self._search_objects("CaseType", query_payload)
         return self._normalize_objects(case_objects)
 
 
-    def get_assigned_cases(self, assignee_oid: str) -> list[dict]:
-        self.logger.debug(f"Starting: assignee_oid={assignee_oid}")
-        query_payload = {
-            "query": {
-                "filter": {
-                    "text": f'state = "open" and workItem/assigneeRef matches (oid = "{assignee_oid}")'
-                }
-            }
+    def _count_objects(self, object_type: str, query_filter: dict, exclude: list[str] = None, page_size: int = 500) -> int:
+        """
+        Count objects matching a filter. midPoint's REST search has no count-only response, so this
+        pages through oid-ordered raw results, with the items in exclude left out of the transfer,
+        without normalizing (or resolving references of) any of them.
+        """
+        self.logger.debug("Starting: object_type={}, query_filter={}", object_type, query_filter)
+        count = 0
+        for page, _checkpoint in self.iter_object_pages(object_type, query_filter=query_filter, page_size=page_size, exclude=exclude):
+            count += len(page)
+        return count
+
+
+    def get_requested_cases(self, requestor_oid: str, offset: int = None, limit: int = None, order_by: str = None, order_direction: str = "ascending") -> list[dict]:
+        """
+        Open cases requested by requestor_oid. offset/limit/order_by map to midPoint paging.
+        """
+        self.logger.debug("Starting: requestor_oid={}, offset={}, limit={}, order_by={}", requestor_oid, offset, limit, order_by)
+        return self._search_cases(self._requested_cases_filter(requestor_oid), offset=offset, limit=limit, order_by=order_by, order_direction=order_direction)
+
+
+    def get_assigned_cases(self, assignee_oid: str, offset: int = None, limit: int = None, order_by: str = None, order_direction: str = "ascending") -> list[dict]:
+        """
+        Open cases with a work item assigned to assignee_oid. offset/limit/order_by map to midPoint paging.
+        """
+        self.logger.debug("Starting: assignee_oid={}, offset={}, limit={}, order_by={}", assignee_oid, offset, limit, order_by)
+        return self._search_cases(self._assigned_cases_filter(assignee_oid), offset=offset, limit=limit, order_by=order_by, order_direction=order_direction)
+
+
+    def count_requested_cases(self, requestor_oid: str) -> int:
+        self.logger.debug("Starting: requestor_oid={}", requestor_oid)
+        return self._count_objects("CaseType", self._requested_cases_filter(requestor_oid), exclude=CASE_SUMMARY_EXCLUDE)
+
+
+    def count_assigned_cases(self, assignee_oid: str) -> int:
+        self.logger.debug("Starting: assignee_oid={}", assignee_oid)
+        return self._count_objects("CaseType", self._assigned_cases_filter(assignee_oid), exclude=CASE_SUMMARY_EXCLUDE)
+
+
+    def _case_create_timestamp(self, raw_case: dict) -> str:
+        return raw_case.get("@metadata", {}).get("storage", {}).get("createTimestamp") or raw_case.get("metadata", {}).get("createTimestamp")
+
+
+    def _count_by_reference(self, counts: dict, objects: dict) -> list[dict]:
+        summary = []
+        for (object_type, oid), count in counts.items():
+            obj = objects.get((object_type, oid)) or {}
+            summary.append({"oid": oid, "type": object_type.removesuffix("Type"), "name": extract_display_name(obj.get("name")) or oid, "count": count})
+        return sorted(summary, key=lambda entry: (-entry["count"], entry["name"]))
+
+
+    def get_assigned_cases_summary(self, assignee_oid: str, age_buckets: list[int] = [1, 7, 30], page_size: int = 500) -> dict:
+        """
+        Dashboard summary of the open cases assigned to assignee_oid: total, counts by requestor and
+        by target (most frequent first) and by age in days, split at age_buckets. Cases are paged
+        without their work items, events or contexts, and only the distinct requestors and targets
+        are looked up, in one concurrent round.
+        """
+        self.logger.debug("Starting: assignee_oid={}, age_buckets={}", assignee_oid, age_buckets)
+        now = datetime.now().astimezone()
+        bounds = sorted(age_buckets)
+        labels = [f"{low}-{high}d" for low, high in zip([0] + bounds, bounds)] + [f"{bounds[-1]}d+" if bounds else "all"]
+        by_age = dict.fromkeys(labels, 0)
+        by_requestor = {}
+        by_target = {}
+        total = 0
+        oldest = None
+        for raw_cases, _checkpoint in self.iter_object_pages("CaseType", query_filter=self._assigned_cases_filter(assignee_oid), page_size=page_size, exclude=CASE_SUMMARY_EXCLUDE):
+            for raw_case in raw_cases:
+                total += 1
+                for reference_key, counts in [("requestorRef", by_requestor), ("targetRef", by_target)]:
+                    reference = raw_case.get(reference_key)
+                    if reference and reference.get("oid"):
+                        key = (reference.get("type", "c:ObjectType").removeprefix("c:"), reference["oid"])
+                        counts[key] = counts.get(key, 0) + 1
+                create_timestamp = self._case_create_timestamp(raw_case)
+                if create_timestamp is None:
+                    continue
+                created = datetime.fromisoformat(create_timestamp)
+                if oldest is None or created < datetime.fromisoformat(oldest):
+                    oldest = create_timestamp
+                age_days = (now - created).total_seconds() / 86400
+                by_age[next((label for label, bound in zip(labels, bounds) if age_days < bound), labels[-1])] += 1
+        # references without a known type can't be looked up; they are reported by oid
+        objects = self._get_objects_by_key([key for key in list(by_requestor) + list(by_target) if key[0] in endpoints])
+        self.logger.info(f"Summarized {total} cases assigned to {assignee_oid}")
+        return {
+            "total": total,
+            "by_requestor": self._count_by_reference(by_requestor, objects),
+            "by_target": self._count_by_reference(by_target, objects),
+            "by_age": [{"age": label, "count": count} for label, count in by_age.items()],
+            "oldest_timestamp": oldest
         }
-        case_objects = self._search_objects("CaseType", query_payload)
-        return self._normalize_objects(case_objects)
 
 
     def _decide_work_item(self, case_oid: str, item_id: int, decision: str, comment: str) -> dict:
         """
         Submit an approve or reject decision for a work item.
         """
-        self.logger.debug(f"Starting: case_oid={case_oid}, item_id={item_id}, decision={decision}")
+        self.logger.debug("Starting: case_oid={}, item_id={}, decision={}", case_oid, item_id, decision)
         try:
             # First check if the work item still exists and is open
             cases_endpoint = self._get_endpoint("CaseType")
@@ -456,7 +1454,7 @@ class MidpointClient:
         Approve a work item.
         Returns a result dict with success/already_done/error status.
         """
-        self.logger.debug(f"Approving workItem: {item_id} in case: {case_oid}")
+        self.logger.debug("Approving workItem: {} in case: {}", item_id, case_oid)
         return self._decide_work_item(case_oid=case_oid, item_id=item_id, decision="approve", comment=comment)
 
 
@@ -464,7 +1462,7 @@ class MidpointClient:
         """
         Reject a work item.
         """
-        self.logger.debug(f"Rejecting workItem: {item_id} in case: {case_oid}")
+        self.logger.debug("Rejecting workItem: {} in case: {}", item_id, case_oid)
         return self._decide_work_item(case_oid=case_oid, item_id=item_id, decision="reject", comment=comment)
 
 
@@ -472,42 +1470,37 @@ class MidpointClient:
     # Role
 
     def get_requestable_roles(self, user_oid: str) -> list[dict]:
-        self.logger.debug(f"Starting")
+        self.logger.debug("Starting")
         query_payload = {
             "query": {
                 "filter": { "text": "requestable = true" }
             }
         }
-        roles = self._search_objects(object_type="RoleType", query_payload=query_payload)
-        normalized_user = self.get_user(oid=user_oid)
+        # the role search and the user lookup are independent; the user's references are resolved afterwards
+        roles, raw_user = self._fan_out([
+            lambda: self._search_objects(object_type="RoleType", query_payload=query_payload),
+            lambda: self._get_raw_user(oid=user_oid)
+        ])
+        normalized_user = self._normalize_object(raw_user)
         member_oids = {m["oid"] for m in normalized_user.get("role_membership", [])}
         normalized_roles = self._normalize_objects(roles)
         return [r for r in normalized_roles if r.get("oid") not in member_oids]
 
 
     def request_role_assignment(self, assignee_type: str, assignee_oid: str, role_oid: str) -> dict:
-        self.logger.debug(f"Starting: assignee_type={assignee_type}, assignee_oid={assignee_oid}, role_oid={role_oid}")
-        request_body = {
-            "objectModification": {
-                "itemDelta": [
-                    {
-                        "modificationType": "add",
-                        "path": "assignment",
-                        "value": [
-                            {
-                                "targetRef": {
-                                    "oid": role_oid,
-                                    "type": "c:RoleType",
-                                    "relation": "org:default",
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
-        }
+        self.logger.debug("Starting: assignee_type={}, assignee_oid={}, role_oid={}", assignee_type, assignee_oid, role_oid)
+        request_body = build_object_modification(
+            build_item_delta("add", "assignment", {
+                "targetRef": {
+                    "oid": role_oid,
+                    "type": "c:RoleType",
+                    "relation": "org:default",
+                }
+            })
+        )
         json_resp = self._http_patch(path=self._get_endpoint(assignee_type) + "/" + assignee_oid, body=request_body, expected_status=[204])
-        self.logger.debug(f"json_resp={json_resp}")
+        self._invalidate_object(assignee_type, assignee_oid)
+        self.logger.debug("json_resp={}", json_resp)
         role_object = self._get_object(object_type="RoleType", object_oid=role_oid)
         return {"role_name": role_object["name"], "status": "success", "message": "Role requested"}
 
@@ -515,9 +1508,8 @@ class MidpointClient:
     # ###############################################################################
     # User
 
-    def get_user(self, oid: str = None, name: str = None) -> dict:
+    def _get_raw_user(self, oid: str = None, name: str = None) -> dict:
         object_type = "UserType"
-        self.logger.debug(f"Starting: oid={oid}, name={name}")
         object = {}
         if oid is not None:
             object = self._get_object(object_type=object_type, object_oid=oid)
@@ -528,13 +1520,680 @@ class MidpointClient:
         self.logger.trace("object: {}", object)
         if "@type" not in object:
             object["@type"] = f"c:{object_type}"
-        return self._normalize_object(object)
+        return object
+
+
+    def get_user(self, oid: str = None, name: str = None, compact: bool = False) -> dict:
+        """
+        Normalized user. With compact, a CompactUser whose role references are shared with every
+        other compact user of this client (to_dict() gives the normalized dict back).
+        """
+        self.logger.debug("Starting: oid={}, name={}, compact={}", oid, name, compact)
+        normalized_user = self._normalize_object(self._get_raw_user(oid=oid, name=name))
+        if compact:
+            return self._interner.user(normalized_user)
+        return normalized_user
+
+
+    def _search_users_chunk(self, query_filter: dict) -> list[dict]:
+        raw_users = self._search_objects(object_type="UserType", query_payload={"query": {"filter": query_filter}})
+        for raw_user in raw_users:
+            raw_user.setdefault("@type", "c:UserType")
+            self._object_cache.store(("UserType", raw_user["oid"]), raw_user.get("version"), raw_user)
+        return raw_users
+
+
+    def get_users(self, oids: list[str] = None, names: list[str] = None, chunk_size: int = 100, compact: bool = False) -> list:
+        """
+        Normalized users for several oids or names, looked up with one inOid (or 'or' of name equal)
+        search per chunk_size entries, chunks running concurrently; the role references of all users
+        are resolved once. Results follow the requested order; entries that do not exist are returned
+        as {"status": "not_found", "oid"|"name": ...}. With compact, found users are CompactUsers.
+        """
+        self.logger.debug("Starting: oids={}, names={}, chunk_size={}, compact={}", oids, names, chunk_size, compact)
+        if (oids is None) == (names is None):
+            raise Exception("Either oids or names must be specified.")
+        key_attr = "oid" if oids is not None else "name"
+        keys = list(oids if oids is not None else names)
+        unique_keys = list(dict.fromkeys(keys))
+        chunks = [unique_keys[i:i + chunk_size] for i in range(0, len(unique_keys), chunk_size)]
+        if key_attr == "oid":
+            filters = [{"inOid": {"value": chunk}} for chunk in chunks]
+        else:
+            filters = [{"or": {"equal": [{"path": "name", "value": name} for name in chunk]}} for chunk in chunks]
+        raw_users = [raw_user for page in self._fan_out([lambda query_filter=query_filter: self._search_users_chunk(query_filter) for query_filter in filters]) for raw_user in page]
+        normalized_users = {}
+        for normalized_user in self._normalize_objects(raw_users):
+            key = normalized_user.get("oid") if key_attr == "oid" else extract_display_name(normalized_user.get("name"))
+            normalized_users[key] = self._interner.user(normalized_user) if compact else normalized_user
+        self.logger.info(f"Found {len(normalized_users)} of {len(unique_keys)} requested users")
+        return [normalized_users.get(key, {"status": "not_found", key_attr: key}) for key in keys]
+
+
+    # ###############################################################################
+    # Snapshot
+
+    def _snapshot_for(self, object_type: str) -> "ObjectSnapshotStore":
+        """The snapshot store if it covers object_type for this principal, refreshed first if it is due."""
+        if self._snapshot is None or self._principal != self._snapshot_principal or not self._snapshot.covers(object_type):
+            return None
+        if self._snapshot.get_refresh(object_type) is not None:
+            with self._snapshot_lock:
+                # another thread may have refreshed it while this one waited
+                refresh = self._snapshot.get_refresh(object_type)
+                if refresh is not None:
+                    try:
+                        self.refresh_snapshot(object_type, full=refresh["since"] is None)
+                    except Exception as e:
+                        if self._snapshot.is_empty(object_type):
+                            raise
+                        self.logger.warning(f"Snapshot refresh of {object_type} failed, serving the previous snapshot: {e}")
+        return self._snapshot
+
+
+    def refresh_snapshot(self, object_type: str, full: bool = False, page_size: int = 500):
+        """
+        Bring the snapshot of object_type up to date: only objects changed since the last refresh,
+        or every object (dropping deleted ones) when full or the type was never loaded.
+        """
+        since = None if full else self._snapshot.get_watermark(object_type)
+        self.logger.debug("Starting: object_type={}, since={}", object_type, since)
+        started_at = time.time()
+        watermark = self._latest_change_timestamp(object_type) or since
+        for raw_objects, _checkpoint in self.iter_object_pages(object_type, query_filter=self._changes_filter(since), page_size=page_size):
+            self._snapshot.store(object_type, raw_objects, started_at)
+        self._snapshot.mark_refreshed(object_type, watermark, started_at, full=since is None)
+        self.logger.info(f"Snapshot of {object_type} refreshed, since: {since}, watermark: {watermark}")
+
+
+    # ###############################################################################
+    # Change feed
+
+    def _changes_filter(self, since: str) -> dict:
+        if since is None:
+            return None
+        return {"or": {"greater": [{"path": MODIFY_TIMESTAMP_PATH, "value": since}, {"path": CREATE_TIMESTAMP_PATH, "value": since}]}}
+
+
+    def _object_timestamps(self, raw_object: dict) -> list[str]:
+        """Create/modify timestamps of a raw object, from legacy metadata or storage value metadata."""
+        timestamps = []
+        for metadata in [raw_object.get("metadata", {}), raw_object.get("@metadata", {}).get("storage", {})]:
+            for attr in ["createTimestamp", "modifyTimestamp"]:
+                if metadata.get(attr):
+                    timestamps.append(metadata[attr])
+        return timestamps
+
+
+    def _latest_change_timestamp(self, object_type: str) -> str:
+        """The most recent create/modify timestamp in the repository for object_type, read from the server."""
+        calls = []
+        for path in [MODIFY_TIMESTAMP_PATH, CREATE_TIMESTAMP_PATH]:
+            query_payload = {"query": {"paging": build_paging(limit=1, order_by=path, order_direction="descending")}}
+            calls.append(lambda query_payload=query_payload: self._search_objects(object_type, query_payload))
+        timestamps = [timestamp for page in self._fan_out(calls) for raw_object in page for timestamp in self._object_timestamps(raw_object)]
+        return max(timestamps, key=datetime.fromisoformat, default=None)
+
+
+    def get_changes(self, object_type: str = "UserType", since: str = None, page_size: int = 500, on_page=None) -> dict:
+        """
+        Objects of object_type created or modified after since (an xsd:dateTime watermark; None for
+        all), paged in oid order and normalized a page at a time with batched reference resolution.
+        Returns {"objects": [...], "watermark": ...}; pass the watermark to the next call. With
+        on_page(normalized_objects), pages are handed over as they arrive and "objects" stays empty.
+        The watermark is the server's latest change time taken before paging starts, so a change
+        made during the sync is returned again next time rather than missed.
+        """
+        self.logger.debug("Starting: object_type={}, since={}", object_type, since)
+        watermark = self._latest_change_timestamp(object_type) or since
+        objects = []
+        for raw_objects, _checkpoint in self.iter_object_pages(object_type, query_filter=self._changes_filter(since), page_size=page_size):
+            for raw_object in raw_objects:
+                raw_object.setdefault("@type", f"c:{object_type}")
+            normalized_objects = self._normalize_objects(raw_objects)
+            if on_page is not None:
+                on_page(normalized_objects)
+            else:
+                objects.extend(normalized_objects)
+        self.logger.info(f"Changes of {object_type} since {since} done, watermark: {watermark}")
+        return {"objects": objects, "watermark": watermark}
+
+
+    # ###############################################################################
+    # Export
+
+    def iter_object_pages(self, object_type: str, query_filter: dict = None, page_size: int = 500, checkpoint: dict = None, keyset: bool = True, exclude: list[str] = None, options: list[str] = None):
+        """
+        Yield (raw_objects, checkpoint) for each page of object_type in oid order. A checkpoint is
+        {"offset": objects before the next page, "oid": last oid seen}; pass one back to resume.
+        With keyset (default) pages continue after the last oid, which stays correct and cheap
+        deep into large repositories; otherwise plain offset paging is used. exclude and options
+        are passed to _search_objects.
+        """
+        checkpoint = dict(checkpoint) if checkpoint else {"offset": 0, "oid": None}
+        self.logger.debug("Starting: object_type={}, query_filter={}, checkpoint={}", object_type, query_filter, checkpoint)
+        while True:
+            if keyset:
+                query_payload = {"query": {"paging": build_paging(limit=page_size, order_by=OID_PATH)}}
+                page_filter = _keyset_filter(query_filter, checkpoint["oid"]) if checkpoint["oid"] else query_filter
+            else:
+                query_payload = {"query": {"paging": build_paging(offset=checkpoint["offset"], limit=page_size, order_by=OID_PATH)}}
+                page_filter = query_filter
+            if page_filter:
+                query_payload["query"]["filter"] = page_filter
+            page = self._search_objects(object_type, query_payload, exclude=exclude, options=options)
+            if not page:
+                return
+            checkpoint = {"offset": checkpoint["offset"] + len(page), "oid": page[-1]["oid"]}
+            yield page, checkpoint
+            if len(page) < page_size:
+                return
+
+
+    def _export_row(self, normalized_user: dict) -> dict:
+        row = {}
+        for column in USER_EXPORT_COLUMNS:
+            value = normalized_user.get(column, "")
+            if isinstance(value, list):
+                value = ";".join(extract_display_name(reference.get("name")) for reference in value)
+            elif isinstance(value, dict):
+                value = extract_display_name(value)
+            row[column] = value
+        return row
+
+
+    def export_users(self, output, output_format: str = "jsonl", query_filter: dict = None, page_size: int = 500, checkpoint: dict = None, processes: int = None, on_checkpoint=None) -> dict:
+        """
+        Stream normalized users (normalized_schema/user.json shape) to output, a path or a text file
+        object, as "jsonl" or "csv" (role lists flattened to ';'-separated names). Users are read in
+        oid-ordered pages and each page's references are resolved in one batch, so memory stays
+        constant. Pass a checkpoint to resume (a path is then appended to); on_checkpoint(checkpoint)
+        is called after each written page. processes > 0 normalizes pages in a process pool.
+        Returns the final checkpoint.
+        """
+        self.logger.debug("Starting: output={}, output_format={}, checkpoint={}, processes={}", output, output_format, checkpoint, processes)
+        if output_format not in ["jsonl", "csv"]:
+            raise MidpointError(f"Unsupported export format: {output_format}")
+        output_file = open(output, "a" if checkpoint else "w", newline="") if isinstance(output, str) else output
+        csv_writer = None
+        if output_format == "csv":
+            csv_writer = csv.DictWriter(output_file, fieldnames=USER_EXPORT_COLUMNS)
+            if not checkpoint:
+                csv_writer.writeheader()
+        final_checkpoint = checkpoint
+
+        def write_page(normalized_users, page_checkpoint):
+            for normalized_user in normalized_users:
+                if csv_writer is not None:
+                    csv_writer.writerow(self._export_row(normalized_user))
+                else:
+                    output_file.write(json.dumps(normalized_user) + "\n")
+            output_file.flush()
+            if on_checkpoint is not None:
+                on_checkpoint(page_checkpoint)
+
+        pool = ProcessPoolExecutor(max_workers=processes) if processes else None
+        pending = deque()
+        try:
+            for raw_users, page_checkpoint in self.iter_object_pages("UserType", query_filter=query_filter, page_size=page_size, checkpoint=checkpoint):
+                for raw_user in raw_users:
+                    raw_user.setdefault("@type", "c:UserType")
+                if pool is None:
+                    write_page(self._normalize_objects(raw_users), page_checkpoint)
+                else:
+                    resolved = self._resolve_references([reference for raw_user in raw_users for reference in collect_references(raw_user)])
+                    pending.append((pool.submit(normalize_objects, raw_users, resolved), page_checkpoint))
+                    # keep a bounded number of pages in flight; write them in order
+                    while len(pending) > processes:
+                        future, done_checkpoint = pending.popleft()
+                        write_page(future.result(), done_checkpoint)
+                final_checkpoint = page_checkpoint
+            while pending:
+                future, done_checkpoint = pending.popleft()
+                write_page(future.result(), done_checkpoint)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if isinstance(output, str):
+                output_file.close()
+        self.logger.info(f"Export finished, checkpoint: {final_checkpoint}")
+        return final_checkpoint
+
 
+    # ###############################################################################
+    # Shadow
+
+    def _shadows_filter(self, resource_oid: str, kind: str = None, intent: str = None, situation: str = None) -> dict:
+        equal = [{"path": path, "value": value} for path, value in [("kind", kind), ("intent", intent), ("synchronizationSituation", situation)] if value is not None]
+        return build_and_filter({"ref": {"path": "resourceRef", "value": {"oid": resource_oid}}}, {"equal": equal} if equal else None)
+
+
+    def iter_shadows(self, resource_oid: str, kind: str = None, intent: str = None, situation: str = None, page_size: int = 500, checkpoint: dict = None, on_checkpoint=None):
+        """
+        Yield the normalized shadows of a resource (ResourceType oid), optionally only those of a kind
+        ("account", "entitlement", "generic"), intent and synchronization situation ("linked",
+        "unlinked", "unmatched", "disputed", "deleted"). Shadows are read from midPoint's repository
+        (noFetch, raw), never from the connected system, in oid-ordered pages, so memory stays bounded
+        by page_size. Pass a checkpoint to resume; on_checkpoint(checkpoint) is called after each page.
+        """
+        self.logger.debug("Starting: resource_oid={}, kind={}, intent={}, situation={}, checkpoint={}", resource_oid, kind, intent, situation, checkpoint)
+        query_filter = self._shadows_filter(resource_oid, kind=kind, intent=intent, situation=situation)
+        count = 0
+        for raw_shadows, page_checkpoint in self.iter_object_pages("ShadowType", query_filter=query_filter, page_size=page_size, checkpoint=checkpoint, options=["noFetch", "raw"]):
+            for raw_shadow in raw_shadows:
+                raw_shadow.setdefault("@type", "c:ShadowType")
+                yield self._normalize_object(raw_shadow, {})
+            count += len(raw_shadows)
+            if on_checkpoint is not None:
+                on_checkpoint(page_checkpoint)
+        self.logger.info(f"Read {count} shadows of resource {resource_oid}")
+
+
+    # ###############################################################################
+    # Org
+
+    def refresh_org_tree(self, full: bool = False, page_size: int = 500) -> OrgTree:
+        """
+        Bring the org hierarchy up to date: orgs created or modified since the last refresh, or every
+        org (dropping deleted ones) when full or never loaded. Orgs are read on behalf of the client's
+        own principal with paged searches; a full load takes them from the snapshot store instead when
+        one covers OrgType.
+        """
+        owner = self.for_principal(self._snapshot_principal)
+        org_tree = self._org_tree
+        since = None if full else org_tree.watermark
+        self.logger.debug("Starting: since={}", since)
+        started_at = time.monotonic()
+        snapshot = owner._snapshot_for("OrgType") if since is None else None
+        if snapshot is not None:
+            watermark = snapshot.get_watermark("OrgType")
+            raw_orgs = snapshot.get_all("OrgType")
+        else:
+            watermark = owner._latest_change_timestamp("OrgType") or since
+            raw_orgs = [raw_org for page, _checkpoint in owner.iter_object_pages("OrgType", query_filter=owner._changes_filter(since), page_size=page_size, exclude=ORG_TREE_EXCLUDE) for raw_org in page]
+        if since is None:
+            org_tree.replace(raw_orgs)
+            org_tree.full_refreshed_at = started_at
+        else:
+            org_tree.update(raw_orgs)
+        org_tree.watermark = watermark
+        org_tree.refreshed_at = started_at
+        self.logger.info(f"Org tree refreshed with {len(raw_orgs)} org/s, since: {since}, watermark: {watermark}")
+        return org_tree
+
+
+    def _org_tree_refresh(self) -> dict:
+        """None if the org hierarchy can be used as is, else {"full": ...} for refresh_org_tree."""
+        org_tree = self._org_tree
+        now = time.monotonic()
+        if org_tree.full_refreshed_at is None or now - org_tree.full_refreshed_at >= self._org_tree_full_refresh_after:
+            return {"full": True}
+        if now - org_tree.refreshed_at >= self._org_tree_refresh_after:
+            return {"full": False}
+        return None
+
+
+    def get_org_tree(self) -> OrgTree:
+        """The org hierarchy, refreshed first when it is due."""
+        if self._org_tree_refresh() is not None:
+            with self._org_tree_lock:
+                # checked again under the lock, so concurrent callers load the hierarchy once
+                refresh = self._org_tree_refresh()
+                if refresh is not None:
+                    self.refresh_org_tree(full=refresh["full"])
+        return self._org_tree
+
+
+    def get_org_ancestors(self, org_oid: str) -> list[dict]:
+        """{"oid", "name", "parents"} of every org above org_oid, nearest first."""
+        org_tree = self.get_org_tree()
+        # parents that are not (or no longer) orgs in the hierarchy are skipped
+        return [org for org in map(org_tree.get, org_tree.ancestors(org_oid)) if org is not None]
+
+
+    def get_org_descendants(self, org_oid: str) -> list[dict]:
+        """{"oid", "name", "parents"} of every org below org_oid, nearest first."""
+        org_tree = self.get_org_tree()
+        return [org for org in map(org_tree.get, org_tree.descendants(org_oid)) if org is not None]
+
+
+    def get_user_org_paths(self, user_oid: str) -> list[list[dict]]:
+        """The org path (root first) of each org user_oid is a member of."""
+        self.logger.debug("Starting: user_oid={}", user_oid)
+        raw_user = self._get_raw_user(oid=user_oid)
+        org_tree = self.get_org_tree()
+        return [org_tree.path(reference["oid"]) for reference in as_list(raw_user.get("parentOrgRef")) if _is_default_relation(reference)]
+
+
+    def is_user_in_org_subtree(self, user_oid: str, org_oid: str) -> bool:
+        self.logger.debug("Starting: user_oid={}, org_oid={}", user_oid, org_oid)
+        raw_user = self._get_raw_user(oid=user_oid)
+        parent_oids = [reference["oid"] for reference in as_list(raw_user.get("parentOrgRef")) if _is_default_relation(reference)]
+        return self.get_org_tree().in_subtree(parent_oids, org_oid)
+
+
+    def iter_org_subtree_members(self, org_oid: str, object_type: str = "UserType", page_size: int = 500, chunk_size: int = 100):
+        """
+        Yield the raw members (object_type objects with a default-relation parentOrgRef) of org_oid and
+        every org below it. The subtree comes from the local hierarchy; members are searched in pages,
+        chunk_size orgs per search, and each member is yielded once.
+        """
+        self.logger.debug("Starting: org_oid={}, object_type={}", org_oid, object_type)
+        subtree = [org_oid] + self.get_org_tree().descendants(org_oid)
+        seen = set()
+        for chunk in [subtree[i:i + chunk_size] for i in range(0, len(subtree), chunk_size)]:
+            query_filter = {"ref": {"path": "parentOrgRef", "value": [{"oid": oid, "relation": "org:default"} for oid in chunk]}}
+            for raw_members, _checkpoint in self.iter_object_pages(object_type, query_filter=query_filter, page_size=page_size):
+                for raw_member in raw_members:
+                    if raw_member["oid"] not in seen:
+                        seen.add(raw_member["oid"])
+                        yield raw_member
 
 
 
+
+def extract_display_name(ref_or_poly) -> str:
+    """Extract a human-readable name from a Midpoint polyString or objectRef."""
+    if not ref_or_poly:
+        return ""
+    if isinstance(ref_or_poly, str):
+        return ref_or_poly
+    if isinstance(ref_or_poly, dict):
+        return (
+            ref_or_poly.get("orig")
+            or ref_or_poly.get("targetName", {}).get("orig", "")
+            or ref_or_poly.get("name", {}).get("orig", "")
+            or ""
+        )
+    return ""
+
+
+def collect_references(raw_object: dict) -> list[dict]:
+    """Return the references normalize_object needs in resolved for raw_object, so they can be fetched together beforehand."""
+    object_type = raw_object.get("@type", "").removeprefix("c:").removesuffix("Type")
+    references = []
+    match object_type:
+        case "Case":
+            if "workItem" not in raw_object:
+                return references
+            for reference in ["object", "target", "requestor"]:
+                if f"{reference}Ref" in raw_object:
+                    references.append(raw_object[f"{reference}Ref"])
+            for workitem in as_list(raw_object["workItem"]):
+                references.extend(as_list(workitem.get("assigneeRef")))
+        case "User":
+            for assignment in as_list(raw_object.get("assignment")):
+                targetRef = assignment.get("targetRef", {})
+                if targetRef.get("type", "").removeprefix("c:") == "RoleType" and assignment.get("activation", {}).get("effectiveStatus") == "enabled":
+                    references.append(targetRef)
+            for reference in as_list(raw_object.get("roleMembershipRef")):
+                if reference["type"].removeprefix("c:") == "RoleType":
+                    references.append(reference)
+    return references
+
+
+def _normalize_object_reference(reference: dict, resolved: dict, allowed_type: str = "*") -> dict:
+    normalized_reference = {}
+    reference_type = reference["type"].removeprefix("c:")
+    reference_oid = reference["oid"]
+    if allowed_type == "*" or reference_type == allowed_type:
+        normalized_reference["type"] = reference_type.removesuffix("Type")
+        normalized_reference["oid"] = reference_oid
+        normalized_reference["name"] = resolved[(reference_type, reference_oid)]["name"]
+        if "relation" in reference:
+            normalized_reference["relation"] = reference["relation"]
+    return normalized_reference
+
+
+def _normalize_object_references(references, resolved: dict, allowed_type: str = "*") -> list[dict]:
+    normalized_references = []
+    for reference in as_list(references):
+        normalized_reference = _normalize_object_reference(reference, resolved, allowed_type)
+        if normalized_reference:
+            normalized_references.append(normalized_reference)
+    return normalized_references
+
+
+def _normalize_assignments(assignments, resolved: dict, allowed_type: str = "*", allowed_status: str = "*") -> list[dict]:
+    normalized_assignments = []
+    for assignment in as_list(assignments):
+        targetRef = assignment["targetRef"]
+        target_type = targetRef["type"].removeprefix("c:")
+        assignment_status = assignment.get("activation").get("effectiveStatus")
+        if allowed_type in ["*", target_type] and allowed_status in ["*", assignment_status]:
+            target_oid = targetRef["oid"]
+            normalized_assignments.append({
+                "type": target_type.removesuffix("Type"),
+                "oid": target_oid,
+                "relation": targetRef["relation"],
+                "name": resolved[(target_type, target_oid)]["name"]
+            })
+    return normalized_assignments
+
+
+def _normalize_case_workitems(workitems, resolved: dict) -> list[dict]:
+    normalized_workitems = []
+    for workitem in as_list(workitems):
+        normalized_workitems.append({
+            "id": workitem["@id"],
+            "name": workitem["name"]["orig"],
+            "assignee": _normalize_object_reference(workitem["assigneeRef"], resolved)
+        })
+    return normalized_workitems
+
+
+def normalize_object(raw_object: dict, resolved: dict) -> dict:
+    """
+    Normalize a raw midPoint object (normalized_schema/*.json shape). resolved maps (object_type, oid)
+    to the objects behind the references listed by collect_references, so no request is needed.
+    Returns {} for objects to discard (parent cases without work items).
+    """
+    normalized_object = {}
+    object_type = ""
+
+    if "@type" in raw_object:
+        object_type = raw_object["@type"].removeprefix("c:").removesuffix("Type")
+        normalized_object["object_type"]=object_type
+
+    for attr in ["oid", "name", "description"]:
+        if attr in raw_object:
+            normalized_object[attr]=raw_object[attr]
+
+    match object_type:
+        case "Case":
+            if "workItem" not in raw_object:
+                # discard parent "empty" case
+                return {}
+            for attr in ["state"]:
+                if attr in raw_object:
+                    normalized_object[attr]=raw_object[attr]
+            normalized_object["create_timestamp"]=raw_object.get("@metadata", {}).get("storage", {}).get("createTimestamp")
+            for reference in ["object", "target", "requestor"]:
+                reference_key = f"{reference}Ref"
+                if reference_key in raw_object:
+                    normalized_object[reference] = _normalize_object_reference(raw_object[reference_key], resolved)
+            normalized_object["workitems"] = _normalize_case_workitems(raw_object["workItem"], resolved)
+            # override name
+            name_orig = normalized_object["name"]["orig"]
+            normalized_object["name"] = name_orig
+        case "Shadow":
+            for attr in ["kind", "intent", "dead", "exists", "primaryIdentifierValue"]:
+                if attr in raw_object:
+                    normalized_object[attr]=raw_object[attr]
+            normalized_object["resource_oid"] = raw_object.get("resourceRef", {}).get("oid")
+            normalized_object["object_class"] = raw_object.get("objectClass", "").split(":")[-1] or None
+            normalized_object["situation"] = raw_object.get("synchronizationSituation")
+            normalized_object["synchronization_timestamp"] = raw_object.get("synchronizationTimestamp")
+            # repository shadows only hold identifiers and cached attributes; drop namespace prefixes (ri:, icfs:)
+            normalized_object["attributes"] = {name.split(":")[-1]: value for name, value in raw_object.get("attributes", {}).items() if not name.startswith("@")}
+        case "Role":
+            for attr in ["requestable"]:
+                if attr in raw_object:
+                    normalized_object[attr]=raw_object[attr]
+        case "User":
+            for attr in ["givenName", "familyName", "fullName", "emailAddress", "title", "personalNumber"]:
+                if attr in raw_object:
+                    normalized_object[attr]=raw_object[attr]
+            if "extension" in raw_object:
+                extension = raw_object["extension"]
+                for ext_attr in ["metaPersonalEmail"]:
+                    normalized_object[ext_attr] = extension[ext_attr]
+            normalized_object["role_assignment"] = _normalize_assignments(raw_object.get("assignment", []), resolved, "RoleType", "enabled")
+            normalized_object["role_membership"] = _normalize_object_references(raw_object.get("roleMembershipRef", []), resolved, "RoleType")
+    return normalized_object
+
+
+def normalize_objects(raw_objects: list[dict], resolved: dict) -> list[dict]:
+    """normalize_object for each of raw_objects, dropping discarded ones. Needs no client, so it can run in a process pool."""
+    normalized_objects = [normalize_object(raw_object, resolved) for raw_object in raw_objects]
+    return [normalized_object for normalized_object in normalized_objects if normalized_object]
+
+
+class MidpointClientPool:
+    """
+    MidpointClients for several tenants (separate midPoint instances), each balanced over the
+    URLs of its nodes. All tenants share one connection pool, and client(tenant, on_behalf)
+    returns cheap per-call views instead of building a client per end user.
+    """
+    def __init__(self, logger: Logger = None, timeout: int = 10, max_concurrency: int = 8, revalidate_after: float = 0, max_failures: int = 3, ejection_time: float = 30):
+        self.logger = logger if logger is not None else Logger("MidpointClientPool")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.revalidate_after = revalidate_after
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._clients = {}
+
+
+    def add_tenant(self, tenant: str, node_urls: list[str], mp_username: str, mp_password: str, iterations: int = 10, interval: int = 10, snapshot: ObjectSnapshotStore = None, admission: AdmissionController = None) -> MidpointClient:
+        """
+        Register a tenant served by node_urls (midPoint base URLs), optionally with its own snapshot
+        store and admission controller. Waits for the first node once.
+        """
+        self.logger.debug(f"Starting: tenant={tenant}, node_urls={node_urls}")
+        balancer = NodeBalancer([node_url + "/ws/rest" for node_url in node_urls], max_failures=self.max_failures, ejection_time=self.ejection_time, logger=self.logger)
+        client = MidpointClient(node_urls[0], mp_username, mp_password, logger=self.logger, timeout=self.timeout, iterations=iterations, interval=interval, max_concurrency=self.max_concurrency, revalidate_after=self.revalidate_after, session=self.session, balancer=balancer, snapshot=snapshot, admission=admission)
+        self._clients[tenant] = client
+        return client
+
+
+    def client(self, tenant: str = None, on_behalf: str = None) -> MidpointClient:
+        """The tenant's client (tenant may be omitted when there is only one), acting on behalf of on_behalf if given."""
+        if tenant is None:
+            if len(self._clients) != 1:
+                raise MidpointError(f"A tenant must be specified, registered tenants: {list(self._clients)}")
+            tenant = next(iter(self._clients))
+        if tenant not in self._clients:
+            raise MidpointError(f"Unknown tenant: {tenant}")
+        client = self._clients[tenant]
+        if on_behalf is None:
+            return client
+        return client.for_principal(on_behalf)
+
+
+def _call_after_close(response, callback):
+    """Make the first close() of response (a requests.Response) also call callback."""
+    close = response.close
+    def close_and_call():
+        response.close = close
+        try:
+            close()
+        finally:
+            callback()
+    response.close = close_and_call
+
+
+IMPORT_STAGES = ["read", "substitute", "parse", "admission", "http", "wait", "dispatch"]
+_NO_STAGE = contextlib.nullcontext()
+
+
+class ImportProfiler:
+    """
+    Time spent per import stage (IMPORT_STAGES), aggregated per folder and object class.
+    Stages nest (an operation dispatch makes HTTP calls and waits), and each stage is
+    charged only its own time, so the stage columns of a row add up to its total.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._rows = {}
+
+
+    @contextlib.contextmanager
+    def item(self, folder: str, count_file: bool = True):
+        """
+        Profile one imported file; its stages are charged to folder and the class set with set_object_class.
+        A file prepared and uploaded in different threads is profiled twice, counting it only once.
+        """
+        self._local.item = {"folder": folder, "object_class": "-", "stages": dict.fromkeys(IMPORT_STAGES, 0.0)}
+        try:
+            yield
+        finally:
+            item = self._local.item
+            self._local.item = None
+            with self._lock:
+                row = self._rows.setdefault((item["folder"], item["object_class"]), {"files": 0, "stages": dict.fromkeys(IMPORT_STAGES, 0.0)})
+                row["files"] += 1 if count_file else 0
+                for stage, seconds in item["stages"].items():
+                    row["stages"][stage] += seconds
+
+
+    def set_object_class(self, object_class: str):
+        item = getattr(self._local, "item", None)
+        if item is not None:
+            item["object_class"] = object_class
+
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        stack = self._local.__dict__.setdefault("stack", [])
+        frame = [0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            item = getattr(self._local, "item", None)
+            if item is not None:
+                item["stages"][stage] += elapsed - frame[0]
+
+
+    def summary(self) -> dict:
+        """{"rows": [{folder, object_class, files, <stage>..., total}], "by_folder": {...}, "by_class": {...}}, times in seconds."""
+        with self._lock:
+            rows = [dict({"folder": folder, "object_class": object_class, "files": row["files"]}, **row["stages"]) for (folder, object_class), row in sorted(self._rows.items())]
+        by_folder = {}
+        by_class = {}
+        for row in rows:
+            row["total"] = sum(row[stage] for stage in IMPORT_STAGES)
+            for totals, key in [(by_folder, row["folder"]), (by_class, row["object_class"])]:
+                entry = totals.setdefault(key, dict.fromkeys(["files"] + IMPORT_STAGES + ["total"], 0))
+                for column in entry:
+                    entry[column] += row[column]
+        return {"rows": rows, "by_folder": by_folder, "by_class": by_class}
+
+
+    def format_table(self) -> str:
+        columns = ["files"] + IMPORT_STAGES + ["total"]
+        lines = ["{:<30} {:<28} ".format("folder", "object_class") + " ".join("{:>10}".format(column) for column in columns)]
+        summary = self.summary()
+        for row in summary["rows"]:
+            lines.append("{:<30} {:<28} {:>10} ".format(row["folder"], row["object_class"], row["files"]) + " ".join("{:>10.3f}".format(row[column]) for column in columns[1:]))
+        for folder, totals in summary["by_folder"].items():
+            lines.append("{:<30} {:<28} {:>10} ".format(folder, "(all)", totals["files"]) + " ".join("{:>10.3f}".format(totals[column]) for column in columns[1:]))
+        return "\n".join(lines)
+
+
 class Midpoint:
-    def __init__(self, mp_baseurl: str, mp_username: str, mp_password: str, properties: Properties, logger: Logger = None, temp_file_path: str = "/tmp/midpoint_object", iterations: int = 10, interval: int = 10):
+    def __init__(self, mp_baseurl: str, mp_username: str, mp_password: str, properties: Properties, logger: Logger = None, temp_file_path: str = "/tmp/midpoint_object", iterations: int = 10, interval: int = 10, revalidate_after: float = 0, profile: bool = False, profile_file: str = None, admission: AdmissionController = None, priority: str = "bulk"):
         self._logger = logger if logger is not None else Logger("Midpoint")
         self._logger.debug("Midpoint lib version: " + version("sherpa-py-midpoint"))
         self._baseurl = mp_baseurl
@@ -542,12 +2201,20 @@ class Midpoint:
         self._credentials = base64.b64encode(mp_credentials.encode())
         self._properties = properties
         self._temp_file_path = temp_file_path
+        self._object_cache = ObjectVersionCache(revalidate_after=revalidate_after)
+        # per-stage import timing; when off, stages cost one attribute check
+        self._profiler = ImportProfiler() if profile else None
+        # where process_subfolders exports the timings as JSON once it finishes; they are always logged
+        self._profile_file = profile_file
+        # imports are bulk work by default; share the AdmissionController of the portal clients to keep them responsive
+        self._admission = admission
+        self._priority = priority
         url = "{}users/00000000-0000-0000-0000-000000000002".format(self._baseurl)
         headers = {'Authorization': 'Basic {}'.format(self._credentials.decode()), 'Content-Type': 'application/xml'}
         http.wait_for_endpoint(url, iterations, interval, self._logger, headers)
 
 
-    def _midpoint_call(self, method, endpoint, oid, payload, content_type='application/xml'):
+    def _midpoint_call(self, method, endpoint, oid, payload, content_type='application/xml', accept=None, stream=False):
         url = self._baseurl + endpoint
         if method=="GET" or method=="PATCH" or method=="PUT":
             url = url + "/" + oid
@@ -555,19 +2222,54 @@ class Midpoint:
             'Authorization': 'Basic {}'.format(self._credentials.decode()),
             'Content-Type': content_type
         }
+        if accept is not None:
+            headers['Accept'] = accept
         self._logger.debug("Calling URL: {} with method: {}, headers: {}", url, method, headers)
         self._logger.trace("payload: {}", payload)
-        http_response = requests.request(method, url, headers=headers, data=payload)
+        if self._admission is None:
+            with self._stage("http"):
+                http_response = requests.request(method, url, headers=headers, data=payload, stream=stream)
+        else:
+            with self._stage("admission"):
+                self._admission.acquire(self._priority)
+            slot = contextlib.ExitStack()
+            outcome = slot.enter_context(self._admission.held(self._priority))
+            try:
+                with self._stage("http"):
+                    http_response = requests.request(method, url, headers=headers, data=payload, stream=stream)
+            except BaseException:
+                slot.close()
+                raise
+            outcome["status_code"] = http_response.status_code
+            if stream:
+                # the body is still being sent; the slot is freed when the caller closes the response
+                _call_after_close(http_response, slot.close)
+            else:
+                slot.close()
         self._logger.trace("http_response: {}", http_response)
         response_code = http_response.status_code
         self._logger.trace("response_code: {}", response_code)
         if response_code not in [200, 201, 202, 204]:
+            http_response.close()
             validators.raise_and_log(self._logger, IOError, "Invalid HTTP response received: '{}'.", response_code)
+        if stream:
+            # caller reads http_response.raw incrementally and must close the response, which also frees its admission slot
+            http_response.raw.decode_content = True
+            return http_response
         response = http_response.text.encode('utf8')
         self._logger.trace("response: {}", response)
         return response
 
 
+    def _midpoint_json_call(self, method, endpoint, oid, payload=None):
+        """Send an optional dict payload as JSON and return the parsed JSON response ({} when empty)."""
+        json_payload = None if payload is None else json.dumps(payload)
+        response = self._midpoint_call(method, endpoint, oid, json_payload, content_type='application/json', accept='application/json')
+        if not response:
+            return {}
+        return json.loads(response)
+
+
     def _get_endpoint(self, object_type):
         for endpoint_class, endpoint_rest in endpoints.items():
             if endpoint_class.lower().startswith(object_type.lower()):
@@ -592,15 +2294,51 @@ class Midpoint:
         return self._get_endpoint(object_type)
 
 
+    def _get_revalidated_object(self, object_type, object_oid, representation, fetch):
+        """
+        Serve an object from the version cache, revalidating it with an inOid search when stale.
+        fetch() must return (body, version); representation keeps XML and JSON bodies apart.
+        Types that are not version cached are fetched every time.
+        """
+        endpoint = self._get_endpoint(object_type)
+        object_class = next((endpoint_class for endpoint_class, endpoint_rest in endpoints.items() if endpoint_rest == endpoint), None)
+        if not is_version_cached(object_class):
+            return fetch()[0]
+        key = (representation, endpoint, object_oid)
+        body = self._object_cache.get_fresh(key)
+        if body is not None:
+            return body
+        cached_version = self._object_cache.get_version(key)
+        if cached_version is not None:
+            # the check only transfers (about) oid and version; a changed object is then downloaded once, by fetch()
+            current = self.search_objects_json(object_type, {"query": {"filter": {"inOid": {"value": [object_oid]}}}}, exclude=version_check_exclude(object_class))
+            if current and current[0].get("version") == cached_version:
+                self._logger.trace("Object version {} unchanged, type: {}, oid: {}", cached_version, object_type, object_oid)
+                return self._object_cache.revalidated(key)
+        body, version = fetch()
+        self._object_cache.store(key, version, body)
+        return body
+
+
+    def _invalidate_object(self, endpoint, oid):
+        for representation in ["xml", "json"]:
+            self._object_cache.invalidate((representation, endpoint, oid))
+
+
+    def get_metrics(self):
+        return {"object_cache": self._object_cache.stats()}
+
+
     def get_object(self, object_type, object_oid):
         endpoint = self._get_endpoint(object_type)
-        response = self._midpoint_call("GET", endpoint, oid=object_oid, payload=None)
-        return response
+        def fetch():
+            response = self._midpoint_call("GET", endpoint, oid=object_oid, payload=None)
+            return response, ElementTree.fromstring(response).attrib.get("version")
+        return self._get_revalidated_object(object_type, object_oid, "xml", fetch)
 
 
-    def get_object_by_name(self, object_type, object_name):
-        endpoint = self._get_endpoint(object_type) + "/search"
-        payload = """<?xml version="1.0" encoding="utf-8"?>
+    def _name_query(self, object_name):
+        return """<?xml version="1.0" encoding="utf-8"?>
                     <query>
                         <filter>
                             <equal>
@@ -608,19 +2346,84 @@ class Midpoint:
                                 <value>{}</value>
                             </equal>
                         </filter>
-                    </query>""".format(object_name)
-        response = self._midpoint_call("POST", endpoint, payload=payload, oid=None)
-        self._logger.trace("response: {}", response)
-        tree_root = ElementTree.fromstring(response)
-        objects = tree_root.findall('{http://midpoint.evolveum.com/xml/ns/public/common/api-types-3}object')
-        self._logger.trace("objects: {}", objects)
-        object = objects[0]
-        self._logger.trace("object: {}", object)
-        object_string = ElementTree.tostring(object, encoding="unicode")
+                    </query>""".format(escape(object_name))
+
+
+    def iter_search_objects(self, object_type, query_xml):
+        """Run an XML search and yield the found objects as ElementTree elements, parsed incrementally from the response stream."""
+        endpoint = self._get_endpoint(object_type) + "/search"
+        http_response = self._midpoint_call("POST", endpoint, payload=query_xml, oid=None, stream=True)
+        try:
+            yield from iter_xml_objects(http_response.raw)
+        finally:
+            http_response.close()
+
+
+    def get_object_fields_by_name(self, object_type, object_name, fields):
+        """Pull fields (e.g. ['oid', 'resultStatus']) of the object named object_name without parsing the whole response."""
+        endpoint = self._get_endpoint(object_type) + "/search"
+        http_response = self._midpoint_call("POST", endpoint, payload=self._name_query(object_name), oid=None, stream=True)
+        try:
+            fields = find_xml_fields(http_response.raw, fields)
+        finally:
+            http_response.close()
+        self._logger.trace("fields: {}", fields)
+        return fields
+
+
+    def get_object_by_name(self, object_type, object_name):
+        objects = self.iter_search_objects(object_type, self._name_query(object_name))
+        try:
+            object = next(objects, None)
+            if object is None:
+                return None
+            object_string = ElementTree.tostring(object, encoding="unicode")
+        finally:
+            objects.close()
         self._logger.trace("object_string: {}", object_string)
         return object_string
 
 
+    def get_object_json(self, object_type, object_oid):
+        endpoint = self._get_endpoint(object_type)
+        def fetch():
+            object = next(iter(self._midpoint_json_call("GET", endpoint, oid=object_oid).values()), None)
+            return object, None if object is None else object.get("version")
+        return self._get_revalidated_object(object_type, object_oid, "json", fetch)
+
+
+    def search_objects_json(self, object_type, query_payload, exclude=None):
+        endpoint = self._get_endpoint(object_type) + "/search"
+        if exclude:
+            endpoint = endpoint + "?" + urlencode([("exclude", path) for path in exclude])
+        json_response = self._midpoint_json_call("POST", endpoint, oid=None, payload=query_payload)
+        objects = as_list(json_response.get("object", {}).get("object"))
+        self._logger.trace("objects: {}", objects)
+        return objects
+
+
+    def get_object_by_name_json(self, object_type, object_name):
+        objects = self.search_objects_json(object_type, build_equal_query("name", object_name))
+        if not objects:
+            return None
+        return objects[0]
+
+
+    def get_object_by_oid_or_name_json(self, object_type, object_oid=None, object_name=None):
+        object = None
+        if object_oid is not None:
+            object = self.get_object_json(object_type, object_oid)
+            if object is None:
+                raise Exception("object_type: {}, object_oid: {} does not exist.".format(object_type, object_oid))
+        elif object_name is not None:
+            object = self.get_object_by_name_json(object_type, object_name)
+            if object is None:
+                raise Exception("object_type: {}, object_name: {} does not exist.".format(object_type, object_name))
+        else:
+            raise Exception("Either object_oid or object_name must be specified.")
+        return object
+
+
     def get_object_by_oid_or_name(self, object_type, object_oid=None, object_name=None):
         object = {}
         if object_oid is not None:
@@ -642,16 +2445,21 @@ class Midpoint:
 
 
     def put_object(self, xml_data):
-        endpoint = self._get_endpoint_from_document(xml_data)
-        oid = self._get_oid_from_document(xml_data)
+        with self._stage("parse"):
+            object_type = self._get_objectType_from_document(xml_data)
+            endpoint = self._get_endpoint(object_type)
+            oid = self._get_oid_from_document(xml_data)
+        if self._profiler is not None:
+            self._profiler.set_object_class(object_type)
         response = self._midpoint_call("PUT", endpoint, oid=oid, payload=xml_data)
+        self._invalidate_object(endpoint, oid)
         return response
 
 
     def put_object_from_file(self, xml_file):
         self._logger.debug("Starting")
         xml_data = ""
-        with open(xml_file, "r") as file_object:
+        with self._stage("read"), open(xml_file, "r") as file_object:
             xml_data = file_object.read()
             file_object.close()
         response = self.put_object(xml_data)
@@ -661,13 +2469,23 @@ class Midpoint:
     def patch_object(self, xml_data, endpoint, oid):
         self._logger.debug("Starting")
         response = self._midpoint_call("PATCH", endpoint, oid=oid, payload=xml_data)
+        self._invalidate_object(endpoint, oid)
+        return response
+
+
+    def patch_object_json(self, endpoint, oid, *item_deltas):
+        self._logger.debug("Starting")
+        json_data = build_object_modification(*item_deltas)
+        self._logger.trace("Object modification: {}", json_data)
+        response = self._midpoint_json_call("PATCH", endpoint, oid=oid, payload=json_data)
+        self._invalidate_object(endpoint, oid)
         return response
 
 
     def patch_object_from_file(self, xml_file, endpoint, oid):
         self._logger.debug("Starting")
         xml_data = ""
-        with open(xml_file, "r") as file_object:
+        with self._stage("read"), open(xml_file, "r") as file_object:
             xml_data = file_object.read()
             file_object.close()
         response = self.patch_object(xml_data, endpoint, oid)
@@ -688,44 +2506,29 @@ class Midpoint:
         self.wait_for_object(iterations=2, interval=30, object_type=source_type, object_oid=source_oid, object_name=source_name)
         self.wait_for_object(iterations=2, interval=30, object_type=target_type, object_oid=target_oid, object_name=target_name)
 
-        source_object = self.get_object_by_oid_or_name(source_type, source_oid, source_name)
         if source_oid is None:
-            source_oid = self._get_oid_from_document(source_object)
-        target_object = self.get_object_by_oid_or_name(target_type, target_oid, target_name)
+            source_oid = self.get_object_by_oid_or_name_json(source_type, source_oid, source_name)["oid"]
+        target_object = self.get_object_by_oid_or_name_json(target_type, target_oid, target_name)
         if target_oid is None:
-            target_oid = self._get_oid_from_document(target_object)
+            target_oid = target_object["oid"]
 
-        # TODO: verify
         self._logger.debug("Checking if {} already exists from source_type: {}, source_oid: {} to target_type: {}, target_oid: {}.", relationship_type, source_type, source_oid, target_type, target_oid)
-        target_object_normalized = target_object.decode() if type(target_object) is bytes else target_object
-        if source_oid in target_object_normalized:
-            self._logger.debug("Relationship ({}) already exists".format(relationship_type))
-            return
+        for relationship in as_list(target_object.get(relationship_type)):
+            existing_ref = relationship.get("targetRef") or relationship.get("construction", {}).get("resourceRef") or {}
+            if existing_ref.get("oid") == source_oid:
+                self._logger.debug("Relationship ({}) already exists".format(relationship_type))
+                return
 
         self._logger.debug("Adding {} source_type: {}, source_oid: {} to target_type: {}, target_oid: {}", relationship_type, source_type, source_oid, target_type, target_oid)
         if source_type=="ResourceType":
-            new_relationship = """<c:construction>
-                                    <c:resourceRef type="c:ResourceType" oid="{}" />
-                                </c:construction>""".format(source_oid)
+            new_relationship = {"construction": {"resourceRef": {"type": "c:ResourceType", "oid": source_oid}}}
         elif source_type=="RoleType":
-            new_relationship = """<c:targetRef type="c:RoleType" oid="{}" />""".format(source_oid)
+            new_relationship = {"targetRef": {"type": "c:RoleType", "oid": source_oid}}
         else:
             raise Exception("Unknown structure for {}".format(relationship_type))
 
-        xml_data = """<objectModification
-                    xmlns='http://midpoint.evolveum.com/xml/ns/public/common/api-types-3'
-                    xmlns:c='http://midpoint.evolveum.com/xml/ns/public/common/common-3'
-                    xmlns:t='http://prism.evolveum.com/xml/ns/public/types-3'>
-                        <itemDelta>
-                            <t:modificationType>add</t:modificationType>
-                            <t:path>c:{}</t:path>
-                            <t:value>
-                                {}
-                            </t:value>
-                        </itemDelta>
-                    </objectModification>""".format(relationship_type, new_relationship)
         endpoint = self._get_endpoint(target_type)
-        response = self.patch_object(xml_data, endpoint, target_oid)
+        response = self.patch_object_json(endpoint, target_oid, build_item_delta("add", relationship_type, new_relationship))
         return response
 
 
@@ -761,7 +2564,7 @@ class Midpoint:
                         break
                 elif object_name is not None:
                     self._logger.debug("Checking if object exists. Type: {}, name: {}", object_type, object_name)
-                    if self.get_object_by_name(object_type, object_name) is not None:
+                    if self.get_object_by_name_json(object_type, object_name) is not None:
                         object_exists = True
                         self._logger.debug("Checking if object exists. Type: {}, name: {}", object_type, object_name)
                         break
@@ -770,7 +2573,8 @@ class Midpoint:
             except:
                 self._logger.debug("Exception while trying to find object_type: {}, object_oid: {}, object_name: {}", object_type, object_oid, object_name)
             self._logger.trace("Waiting {} seconds for object_type: {}, object_oid: {}, object_name: {}", interval, object_type, object_oid, object_name)
-            time.sleep(interval)
+            with self._stage("wait"):
+                time.sleep(interval)
         if not object_exists:
             raise Exception("Gave up trying to find object_type: {}, object_oid: {}, object_name: {}".format(object_type, object_oid, object_name))
 
@@ -783,6 +2587,7 @@ class Midpoint:
         for object_type_folder in sorted(os.scandir(subfolder_path), key=lambda path: path.name):
             if object_type_folder.is_dir():
                 self.process_folder(object_type_folder.path)
+        self._log_finished_import_profile()
 
 
     def process_folder(self, folder_path):
@@ -795,44 +2600,191 @@ class Midpoint:
                 self._process_file(file)
 
 
+    def _stage(self, stage):
+        if self._profiler is None:
+            return _NO_STAGE
+        return self._profiler.stage(stage)
+
+
+    def _copy_and_replace(self, file, temp_file_path):
+        with self._stage("read"):
+            shutil.copyfile(file.path, temp_file_path)
+        with self._stage("substitute"):
+            self._properties.replace(temp_file_path)
+
+
     def _process_file(self, file):
         if not os.path.exists(file):
             self._logger.error("File not found: {}.", file)
             return
-        
+        if self._profiler is None:
+            self._import_file(file)
+            return
+        with self._profiler.item(os.path.basename(os.path.dirname(file.path))):
+            self._import_file(file)
+
+
+    def _import_file(self, file):
+        _object_class, units = self._prepare_file(file, self._temp_file_path)
+        for unit in units:
+            self._upload_unit(unit)
+
+
+    def _prepare_file(self, file, temp_file_path):
+        """
+        Do the local work for an import file (read, substitute properties, parse) and return
+        (object_class, units), each unit an (endpoint, oid, method, payload) for _upload_unit.
+        JSON operations become ("", "", "OPERATION", operation) units, dispatched in order.
+        """
+        object_class = None
+        units = []
         if file.path.endswith(".xml"):
             self._logger.debug("Processing file: {}.", file.name)
-            shutil.copyfile(file.path, self._temp_file_path)
-            self._properties.replace(self._temp_file_path)
-            self.put_object_from_file(self._temp_file_path)
+            self._copy_and_replace(file, temp_file_path)
+            with self._stage("read"), open(temp_file_path, "r") as file_object:
+                xml_data = file_object.read()
+            with self._stage("parse"):
+                object_class = self._get_objectType_from_document(xml_data)
+                units.append((self._get_endpoint(object_class), self._get_oid_from_document(xml_data), "PUT", xml_data))
 
         if file.is_file() and file.path.endswith(".patch"):
             self._logger.debug("Processing file: {}.", file.name)
-            shutil.copyfile(file.path, self._temp_file_path)
-            self._properties.replace(self._temp_file_path)
+            self._copy_and_replace(file, temp_file_path)
             self._logger.trace("File name: {}.", file.name)
             oid = file.name.split(".")[0]
             folder_path = os.path.dirname(file)
             self._logger.debug("Spliting folder name for endpoint: {}.", folder_path)
             endpoint = folder_path.split("_")[1]
-            self.patch_object_from_file(self._temp_file_path, endpoint, oid)
+            object_class = endpoint
+            with self._stage("read"), open(temp_file_path, "r") as file_object:
+                units.append((endpoint, oid, "PATCH", file_object.read()))
 
         if file.is_file() and file.path.endswith(".json"):
             self._logger.debug("Processing file: {}.".format(file.path))
-            shutil.copyfile(file.path, self._temp_file_path)
-            self._properties.replace(self._temp_file_path)
-            with open(self._temp_file_path) as f:
+            self._copy_and_replace(file, temp_file_path)
+            with self._stage("parse"), open(temp_file_path) as f:
                 json_data = json.load(f)
             if isinstance(json_data, dict):
                 self._logger.trace("Processing operation in JSON (dict): {}".format(json_data))
-                self._process_operation(json_data)
+                json_data = [json_data]
             if isinstance(json_data, list):
                 self._logger.trace("Processing each operation in JSON (list): {}".format(json_data))
-                for operation in json_data:
-                    self._process_operation(operation)
+                units.extend(("", "", "OPERATION", operation) for operation in json_data)
+                object_class = "+".join(sorted({str(operation.get("operation_type")) for operation in json_data}))
+
+        if self._profiler is not None and object_class is not None:
+            self._profiler.set_object_class(object_class)
+        return object_class, units
+
+
+    def _upload_unit(self, unit):
+        endpoint, oid, method, payload = unit
+        match method:
+            case "PUT":
+                response = self._midpoint_call("PUT", endpoint, oid=oid, payload=payload)
+                self._invalidate_object(endpoint, oid)
+                return response
+            case "PATCH":
+                return self.patch_object(payload, endpoint, oid)
+            case "OPERATION":
+                return self._process_operation(payload)
+
+
+    def _put_prepared(self, prepared, stop, entry):
+        """Queue entry, blocking while the queue is full (backpressure). False once the consumer stopped."""
+        while not stop.is_set():
+            try:
+                prepared.put(entry, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def _produce_import_files(self, subfolder_path, prepared, stop):
+        """Producer of process_subfolders_pipelined: prepare every file in order and queue (folder, object_class, units)."""
+        temp_file_path = self._temp_file_path + ".prepared"
+        try:
+            for object_type_folder in sorted(os.scandir(subfolder_path), key=lambda path: path.name):
+                if not object_type_folder.is_dir():
+                    continue
+                for file in sorted(os.scandir(object_type_folder.path), key=lambda path: path.name):
+                    if not file.is_file():
+                        continue
+                    with self._profiler.item(object_type_folder.name) if self._profiler is not None else _NO_STAGE:
+                        object_class, units = self._prepare_file(file, temp_file_path)
+                    if not self._put_prepared(prepared, stop, (object_type_folder.name, object_class, units)):
+                        return
+        except Exception as e:
+            # files prepared before the failure are still uploaded, then the consumer raises it
+            self._put_prepared(prepared, stop, e)
+            return
+        self._put_prepared(prepared, stop, None)
+
+
+    def process_subfolders_pipelined(self, subfolder_path, queue_depth=8):
+        """
+        Same import as process_subfolders, but files are read, substituted and parsed in a
+        background thread while the previous ones are uploaded. Uploads keep the folder (tier)
+        and file order; at most queue_depth prepared files wait for upload.
+        """
+        if not os.path.exists(subfolder_path):
+            self._logger.error("Folder not found: {}.", subfolder_path)
+            return
+        self._logger.debug("Processing dir (pipelined): {}.", subfolder_path)
+        prepared = queue.Queue(maxsize=queue_depth)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce_import_files, args=(subfolder_path, prepared, stop), name="MidpointImportProducer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                entry = prepared.get()
+                if entry is None:
+                    break
+                if isinstance(entry, Exception):
+                    raise entry
+                folder, object_class, units = entry
+                with self._profiler.item(folder, count_file=False) if self._profiler is not None else _NO_STAGE:
+                    if self._profiler is not None and object_class is not None:
+                        self._profiler.set_object_class(object_class)
+                    for unit in units:
+                        self._upload_unit(unit)
+        finally:
+            stop.set()
+            producer.join()
+        self._log_finished_import_profile()
+
+
+    def get_import_profile(self):
+        """Import timings per folder and object class (see ImportProfiler.summary), None unless profile was enabled."""
+        if self._profiler is None:
+            return None
+        return self._profiler.summary()
+
+
+    def log_import_profile(self, json_file=None):
+        """Log the import timings as a table and optionally export them to json_file."""
+        if self._profiler is None:
+            self._logger.warning("Import profiling is not enabled.")
+            return
+        self._logger.info("Import profile (seconds):\n{}", self._profiler.format_table())
+        if json_file is not None:
+            with open(json_file, "w") as f:
+                json.dump(self._profiler.summary(), f, indent=2)
+            self._logger.info("Import profile exported to: {}", json_file)
+
+
+    def _log_finished_import_profile(self):
+        if self._profiler is not None:
+            self.log_import_profile(self._profile_file)
 
 
     def _process_operation(self, json_data):
+        with self._stage("dispatch"):
+            self._dispatch_operation(json_data)
+
+
+    def _dispatch_operation(self, json_data):
         self._logger.trace("Processing operation based on operation_type: {}".format(json_data.get('operation_type')))
         match json_data["operation_type"]:
             case "add_resource_inducement_to_role":
@@ -842,7 +2794,7 @@ class Midpoint:
             case "add_role_inducement_to_archetype":
                 self.add_role_inducement_to_archetype(role_oid=json_data.get('role_oid'), role_name=json_data.get('role_name'), archetype_oid=json_data.get('archetype_oid'), archetype_name=json_data.get('archetype_name'))
             case "set_system_configuration":
-                self.set_system_configuration(modification_type=json_data.get('modification_type'), path=json_data.get('path'), value=json_data.get('value'))
+                self.set_system_configuration(modification_type=json_data.get('modification_type'), path=json_data.get('path'), value=json_data.get('value'), value_format=json_data.get('value_format', "json"))
             case "set_class_logger":
                 self.set_class_logger(package=json_data.get('package'), level=json_data.get('level'))
             case "set_notification_configuration":
@@ -863,10 +2815,25 @@ class Midpoint:
         return system_configuration_object
 
 
-    def set_system_configuration(self, modification_type, path, value):
-        self._logger.debug("set_system_configuration(modification_type={}, path={}, value={}", modification_type, path, value)
-        if isinstance(value, dict):
-            value = self.json_to_xml(value)
+    def get_system_configuration_json(self):
+        self._logger.debug("get_system_configuration_json()")
+        system_configuration_object = self.get_object_json("SystemConfigurationType", "00000000-0000-0000-0000-000000000001")
+        if system_configuration_object is None:
+            raise Exception("SystemConfigurationType does not exist.")
+        return system_configuration_object
+
+
+    def set_system_configuration(self, modification_type, path, value, value_format="json"):
+        """
+        Modify the system configuration item at path. value_format "json" sends value (a dict, a plain
+        value, or None for no value) as JSON; "xml" embeds value, an XML fragment, in an XML itemDelta.
+        """
+        self._logger.debug("set_system_configuration(modification_type={}, path={}, value={}, value_format={}", modification_type, path, value, value_format)
+        endpoint = self._get_endpoint("SystemConfigurationType")
+        if value_format == "json":
+            return self.patch_object_json(endpoint, "00000000-0000-0000-0000-000000000001", build_item_delta(modification_type, path, value))
+        if value_format != "xml":
+            raise Exception("Unknown value_format: {}, expected 'json' or 'xml'.".format(value_format))
         xml_data = """<objectModification
                 xmlns='http://midpoint.evolveum.com/xml/ns/public/common/api-types-3'
                 xmlns:c='http://midpoint.evolveum.com/xml/ns/public/common/common-3'
@@ -879,21 +2846,18 @@ class Midpoint:
                     </itemDelta>
                 </objectModification>""".format(modification_type, path, value)
         self._logger.trace("Object modification: {}", xml_data)
-        endpoint = self._get_endpoint("SystemConfigurationType")
         response = self.patch_object(xml_data, endpoint, "00000000-0000-0000-0000-000000000001")
         return response
 
 
-    def _get_class_loggers(self, xml_content):
+    def _get_class_loggers(self, system_configuration):
         self._logger.trace("Getting existing classLoggers.")
-        ns = {'c': 'http://midpoint.evolveum.com/xml/ns/public/common/common-3'}
-        root = ElementTree.fromstring(xml_content)
-        class_loggers = root.findall('c:logging/c:classLogger', namespaces=ns)
+        class_loggers = as_list(system_configuration.get("logging", {}).get("classLogger"))
         result = []
         for logger in class_loggers:
-            level = logger.find('c:level', namespaces=ns).text
-            package = logger.find('c:package', namespaces=ns).text
-            logger_id = logger.get('id')
+            level = logger.get("level")
+            package = logger.get("package")
+            logger_id = logger.get("@id")
             entry = {
                 "id": logger_id,
                 "operation_type": "set_class_logger",
@@ -911,10 +2875,7 @@ class Midpoint:
 
 
     def add_class_logger(self, package, level):
-        value = """
-                <c:level>{}</c:level>
-                <c:package>{}</c:package>
-        """.format(level, package)
+        value = {"level": level, "package": package}
         path = "c:logging/c:classLogger"
         self.set_system_configuration("ADD", path, value)
 
@@ -925,7 +2886,7 @@ class Midpoint:
 
     def set_class_logger(self, package, level):
         existing_logger_id = None
-        logger_entries = self._get_class_loggers(self.get_system_configuration())
+        logger_entries = self._get_class_loggers(self.get_system_configuration_json())
         self._logger.trace("Existing logger entries: {}", logger_entries)
         for logger_entry in logger_entries:
             self._logger.trace("Checking if logger entry already exist: {}", logger_entry)
@@ -937,15 +2898,13 @@ class Midpoint:
         self.add_class_logger(package, level)
 
 
-    def _get_notification_configuration_handlers(self, xml_content):
+    def _get_notification_configuration_handlers(self, system_configuration):
         self._logger.debug("Getting existing handlers in notification configuration.")
-        ns = {'c': 'http://midpoint.evolveum.com/xml/ns/public/common/common-3'}
-        root = ElementTree.fromstring(xml_content)
-        handlers = root.findall('c:notificationConfiguration/c:handler', namespaces=ns)
+        handlers = as_list(system_configuration.get("notificationConfiguration", {}).get("handler"))
         result = []
         for handler in handlers:
-            handler_id = handler.get('id')
-            handler_name = handler.find('c:name', namespaces=ns).text
+            handler_id = handler.get("@id")
+            handler_name = handler.get("name")
             entry = {
                 "handler_id": handler_id,
                 "handler_name": handler_name
@@ -969,9 +2928,14 @@ class Midpoint:
                 else:
                     self._logger.debug("Keeping {} with {}={}.", child_name, child_attribute_name, child_attribute_value)
                     remaining_childs.append(child_element)
+            if not remaining_childs:
+                # a replace without values empties the container
+                self._logger.trace("No childs left in {}.", parent_path)
+                self.set_system_configuration("REPLACE", parent_path, None)
+                continue
             remaining_childs_str = "\n".join([ElementTree.tostring(e, encoding='unicode') for e in remaining_childs])
             self._logger.trace("New list of childs: {}", remaining_childs_str)
-            self.set_system_configuration("REPLACE", parent_path, remaining_childs_str)
+            self.set_system_configuration("REPLACE", parent_path, remaining_childs_str, value_format="xml")
 
 
     def delete_object_collection_view(self, identifier):
@@ -1004,8 +2968,7 @@ class Midpoint:
     def set_notification_configuration(self, modification_type, path, json):
         notifier_name = json["name"]
         self._logger.debug("notifier_name in user configuration file: {}".format(notifier_name))
-        xml_data = self.json_to_xml(json)
-        handler_entries = self._get_notification_configuration_handlers(self.get_system_configuration())
+        handler_entries = self._get_notification_configuration_handlers(self.get_system_configuration_json())
         self._logger.debug("Existing notification handlers in xml: {}".format(handler_entries))
         handler_id = None
         for handler in handler_entries:
@@ -1014,13 +2977,12 @@ class Midpoint:
                 handler_id = handler.get('handler_id')
                 return
         self._logger.debug("handler_id doesnt exist: {}".format(handler_id))
-        self.set_system_configuration(modification_type, path, xml_data)
+        self.set_system_configuration(modification_type, path, json)
         return
 
 
     def set_message_configuration(self, modification_type, path, json):
-        xml_data = self.json_to_xml(json)
-        self.set_system_configuration(modification_type, path, xml_data)
+        self.set_system_configuration(modification_type, path, json)
         return
 
 
@@ -1029,9 +2991,7 @@ class Midpoint:
         self.wait_for_object(iterations=3, interval=30, object_type=object_type, object_oid=object_oid, object_name=object_name)
         task_completed = False
         for iteration in range(iterations):
-            object_task_string = self.get_object_by_name(object_type, object_name)
-            namespace = {'ns': 'http://midpoint.evolveum.com/xml/ns/public/common/common-3'}
-            result_element = ElementTree.fromstring(object_task_string).find('.//ns:resultStatus', namespace).text
+            result_element = self.get_object_fields_by_name(object_type, object_name, ["resultStatus"]).get("resultStatus")
             self._logger.debug("result_element: {}", result_element)
             self._logger.debug("Iteration #: {}", iteration)
             try:
@@ -1046,7 +3006,8 @@ class Midpoint:
             except:
                 self._logger.debug("Exception while trying to find object_task_string: {}, object_oid: {}, object_name: {}", object_type, object_oid, object_name)
             self._logger.trace("Waiting {} seconds for object_task_string: {}, object_oid: {}, object_name: {}", interval, object_type, object_oid, object_name)
-            time.sleep(interval)
+            with self._stage("wait"):
+                time.sleep(interval)
         if not task_completed:
             raise Exception("Gave up trying to find object_task_string: {}, object_oid: {}, object_name: {}".format(object_type, object_oid, object_name))
 
@@ -1054,34 +3015,137 @@ class Midpoint:
     def set_role_requestable(self, role_name, value):
         self.wait_for_completed_task(iterations=2, interval=30, object_name="AD_GROUP_import")
         self._logger.debug("role_name in user configuration file: {}".format(role_name))
-        role_object = self.get_object_by_name("RoleType", role_name)
-        object_oid = self._get_oid_from_document(role_object)
+        object_oid = self.get_object_by_oid_or_name_json("RoleType", object_name=role_name)["oid"]
         endpoint = self._get_endpoint("roleType")
         self._logger.debug("role oid: {}".format(object_oid))
-        json_data = """{{
-                    "objectModification": {{
-                        "itemDelta": {{
-                            "modificationType": "add",
-                            "path": "requestable",
-                            "value": {}
-                        }}
-                    }}
-                }}""".format(value)
-        response = self._midpoint_call("PATCH", endpoint, object_oid, json_data, content_type='application/json')
+        response = self.patch_object_json(endpoint, object_oid, build_item_delta("add", "requestable", value))
         return response
 
 
-    def resume_task(self, task_oid=None, task_name=None):
-        object_type = "TaskType"
-        task_object = self.get_object_by_oid_or_name(object_type, task_oid, task_name)
-        endpoint = self._get_endpoint(object_type) + "/" + self._get_oid_from_document(task_object) + "/resume"
-        response = self._midpoint_call("POST", endpoint, payload=None, oid=None)
-        self._logger.trace("response: {}", response)
+    def _task_status(self, task):
+        result_status = task.get("resultStatus")
+        if result_status in TASK_SUCCESS_STATUSES:
+            return "success"
+        if result_status in TASK_FAILURE_STATUSES:
+            return "failure"
+        return "in_progress"
+
+
+    def _task_outcome_counts(self, activity, counts):
+        """Sum committed item outcomes (success/failure/skip) of the leaf activities of an activity state."""
+        children = as_list(activity.get("activity"))
+        if children:
+            for child in children:
+                self._task_outcome_counts(child, counts)
+            return counts
+        for committed in as_list(activity.get("progress", {}).get("committed")):
+            outcome = committed.get("outcome", "unknown")
+            counts[outcome] = counts.get(outcome, 0) + int(committed.get("count", 0))
+        return counts
+
+
+    def _task_snapshot(self, task):
+        name = task.get("name")
+        outcomes = self._task_outcome_counts(task.get("activityState", {}).get("activity", {}), {})
+        return {
+            "oid": task["oid"],
+            "name": name.get("orig") if isinstance(name, dict) else name,
+            "execution_state": task.get("executionState"),
+            "result_status": task.get("resultStatus"),
+            "last_run_finish": task.get("lastRunFinishTimestamp"),
+            "progress": int(task.get("progress", 0)),
+            "errors": outcomes.get("failure", 0),
+            "status": self._task_status(task)
+        }
 
 
-    def run_task(self, task_oid=None, task_name=None):
+    def watch_tasks(self, task_oids=None, task_names=None, interval=10, timeout=None, since_finish=None):
+        """
+        Watch several tasks at once with one search per poll, until all of them succeed,
+        any of them fails, or timeout seconds pass. Polling starts at one second and backs
+        off to interval. since_finish maps task oid to the lastRunFinishTimestamp seen before
+        the task was started; such a task is in progress until that timestamp changes.
+        Returns {"status": "success"|"failure"|"timeout", "tasks": [snapshot, ...]}, where each
+        snapshot has progress (processed objects), throughput (objects/s while watched) and errors.
+        Raises an Exception if any of the tasks does not exist.
+        """
+        task_filter = {}
+        if task_oids:
+            task_filter["inOid"] = {"value": list(task_oids)}
+        if task_names:
+            task_filter["equal"] = [{"path": "name", "value": task_name} for task_name in task_names]
+        if not task_filter:
+            raise Exception("Either task_oids or task_names must be specified.")
+        query_payload = {"query": {"filter": {"or": task_filter}}}
+        since_finish = since_finish or {}
+        started_at = time.monotonic()
+        initial_progress = {}
+        sleep = min(1, interval)
+        while True:
+            elapsed = time.monotonic() - started_at
+            snapshots = [self._task_snapshot(task) for task in self.search_objects_json("TaskType", query_payload)]
+            missing = [task_oid for task_oid in task_oids or [] if task_oid not in {snapshot["oid"] for snapshot in snapshots}]
+            missing += [task_name for task_name in task_names or [] if task_name not in {snapshot["name"] for snapshot in snapshots}]
+            if missing:
+                raise Exception("Tasks not found: {}".format(missing))
+            for snapshot in snapshots:
+                initial_progress.setdefault(snapshot["oid"], snapshot["progress"])
+                snapshot["throughput"] = (snapshot["progress"] - initial_progress[snapshot["oid"]]) / elapsed if elapsed > 0 else 0.0
+                if snapshot["oid"] in since_finish and snapshot["last_run_finish"] == since_finish[snapshot["oid"]]:
+                    snapshot["status"] = "in_progress"
+                self._logger.debug("Task: {}, status: {}, progress: {}, throughput: {:.1f}/s, errors: {}", snapshot["name"], snapshot["status"], snapshot["progress"], snapshot["throughput"], snapshot["errors"])
+            if any(snapshot["status"] == "failure" for snapshot in snapshots):
+                return {"status": "failure", "tasks": snapshots}
+            if all(snapshot["status"] == "success" for snapshot in snapshots):
+                return {"status": "success", "tasks": snapshots}
+            if timeout is not None and elapsed + sleep > timeout:
+                self._logger.error("Gave up waiting for tasks after {} seconds.", timeout)
+                return {"status": "timeout", "tasks": snapshots}
+            time.sleep(sleep)
+            sleep = min(sleep * 2, interval)
+
+
+    def _start_task(self, action, task_oid=None, task_name=None):
+        """POST a task action (run/resume); returns the task oid and its lastRunFinishTimestamp before the action."""
         object_type = "TaskType"
-        task_object = self.get_object_by_oid_or_name(object_type, task_oid, task_name)
-        endpoint = self._get_endpoint(object_type) + "/" + self._get_oid_from_document(task_object) + "/run"
-        response = self._midpoint_call("POST", endpoint, payload=None, oid=None)
+        # read uncached: a cached copy could hold the timestamp of a run before the previous one
+        if task_oid is not None:
+            query_payload = {"query": {"filter": {"inOid": {"value": [task_oid]}}}}
+        elif task_name is not None:
+            query_payload = build_equal_query("name", task_name)
+        else:
+            raise Exception("Either task_oid or task_name must be specified.")
+        tasks = self.search_objects_json(object_type, query_payload)
+        if not tasks:
+            raise Exception("Task not found, oid: {}, name: {}".format(task_oid, task_name))
+        task_object = tasks[0]
+        endpoint = self._get_endpoint(object_type)
+        response = self._midpoint_call("POST", endpoint + "/" + task_object["oid"] + "/" + action, payload=None, oid=None)
         self._logger.trace("response: {}", response)
+        self._invalidate_object(endpoint, task_object["oid"])
+        return task_object["oid"], task_object.get("lastRunFinishTimestamp")
+
+
+    def resume_task(self, task_oid=None, task_name=None, wait=False, interval=10, timeout=None):
+        oid, last_run_finish = self._start_task("resume", task_oid, task_name)
+        if wait:
+            return self.watch_tasks(task_oids=[oid], interval=interval, timeout=timeout, since_finish={oid: last_run_finish})
+
+
+    def run_task(self, task_oid=None, task_name=None, wait=False, interval=10, timeout=None):
+        oid, last_run_finish = self._start_task("run", task_oid, task_name)
+        if wait:
+            return self.watch_tasks(task_oids=[oid], interval=interval, timeout=timeout, since_finish={oid: last_run_finish})
+
+
+    def run_tasks(self, task_oids=None, task_names=None, wait=True, interval=10, timeout=None):
+        """Run several tasks and (optionally) watch them together."""
+        since_finish = {}
+        for task_oid in task_oids or []:
+            oid, last_run_finish = self._start_task("run", task_oid=task_oid)
+            since_finish[oid] = last_run_finish
+        for task_name in task_names or []:
+            oid, last_run_finish = self._start_task("run", task_name=task_name)
+            since_finish[oid] = last_run_finish
+        if wait:
+            return self.watch_tasks(task_oids=list(since_finish), interval=interval, timeout=timeout, since_finish=since_finish)
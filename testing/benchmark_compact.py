@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Compares normalized user dicts against the compact model (CompactInterner/CompactUser):
+# retained memory and normalization time, on synthetic users (no midPoint needed).
+# Usage: ./testing/benchmark_compact.py [users] [roles] [roles_per_user]
+
+import os
+import sys
+import time
+import tracemalloc
+
+from sherpa.utils.basics import Logger
+
+sys.path.insert(0, './sherpa/')
+from midpoint.midpoint_lib import CompactInterner
+from midpoint.midpoint_lib import normalize_objects
+
+
+def main():
+	logger = Logger(os.path.basename(__file__))
+	users = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	roles = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+	roles_per_user = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+	result = run(logger, users, roles, roles_per_user)
+	logger.info("{} finished.".format(os.path.basename(__file__)))
+	return result
+
+
+def make_resolved_roles(roles):
+	resolved = {}
+	for index in range(roles):
+		oid = "00000000-0000-1de4-0004-{:012d}".format(index)
+		resolved[("RoleType", oid)] = {"oid": oid, "name": {"orig": "ROLE_{}".format(index), "norm": "role_{}".format(index)}}
+	return resolved
+
+
+def make_raw_users(users, roles, roles_per_user):
+	raw_users = []
+	for index in range(users):
+		role_oids = ["00000000-0000-1de4-0004-{:012d}".format((index + offset) % roles) for offset in range(roles_per_user)]
+		raw_users.append({
+			"@type": "c:UserType",
+			"oid": "00000000-0000-1de4-0001-{:012d}".format(index),
+			"name": {"orig": "user{}".format(index), "norm": "user{}".format(index)},
+			"givenName": {"orig": "Given{}".format(index), "norm": "given{}".format(index)},
+			"familyName": {"orig": "Family{}".format(index), "norm": "family{}".format(index)},
+			"fullName": {"orig": "Given{} Family{}".format(index, index), "norm": "given{} family{}".format(index, index)},
+			"emailAddress": "user{}@example.com".format(index),
+			"assignment": [{"targetRef": {"type": "c:RoleType", "oid": oid, "relation": "org:default"}, "activation": {"effectiveStatus": "enabled"}} for oid in role_oids],
+			"roleMembershipRef": [{"type": "c:RoleType", "oid": oid, "relation": "org:default"} for oid in role_oids]
+		})
+	return raw_users
+
+
+def compact(normalized_users):
+	interner = CompactInterner()
+	return [interner.user(normalized_user) for normalized_user in normalized_users]
+
+
+def measure(logger, label, build):
+	start = time.perf_counter()
+	build()
+	elapsed = time.perf_counter() - start
+	tracemalloc.start()
+	result = build()
+	retained, _peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	logger.info("{:<8} time: {:8.3f}s  retained memory: {:10.1f} MiB".format(label, elapsed, retained / 1024 / 1024))
+	return result
+
+
+def run(logger, users, roles, roles_per_user):
+	logger.info("{} starting: users={}, roles={}, roles_per_user={}.".format(os.path.basename(__file__), users, roles, roles_per_user))
+	resolved = make_resolved_roles(roles)
+	dict_users = measure(logger, "dict", lambda: normalize_objects(make_raw_users(users, roles, roles_per_user), resolved))
+	compact_users = measure(logger, "compact", lambda: compact(normalize_objects(make_raw_users(users, roles, roles_per_user), resolved)))
+	if [compact_user.to_dict() for compact_user in compact_users] != dict_users:
+		logger.error("Compact users differ from normalized dicts.")
+		return 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# Decode throughput of a large synthetic /search response (no midPoint needed): the previous
+# path (resp.text for the trace log, then resp.json()) against json_loads on the raw body,
+# which uses orjson when installed. Also reports the gzip transfer size of the payload.
+# Usage: ./testing/benchmark_json.py [users] [roles_per_user] [rounds]
+
+import gzip
+import json
+import os
+import sys
+import time
+
+import requests
+from sherpa.utils.basics import Logger
+
+sys.path.insert(0, './sherpa/')
+from midpoint.midpoint_lib import json_loads
+from midpoint.midpoint_lib import orjson
+
+
+def main():
+	logger = Logger(os.path.basename(__file__))
+	users = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	roles_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+	rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+	run(logger, users, roles_per_user, rounds)
+	logger.info("{} finished.".format(os.path.basename(__file__)))
+
+
+def make_search_payload(users, roles_per_user):
+	objects = []
+	for index in range(users):
+		role_oids = ["00000000-0000-1de4-0004-{:012d}".format((index + offset) % 200) for offset in range(roles_per_user)]
+		objects.append({
+			"@type": "c:UserType",
+			"oid": "00000000-0000-1de4-0001-{:012d}".format(index),
+			"version": "3",
+			"name": {"orig": "user{}".format(index), "norm": "user{}".format(index)},
+			"givenName": {"orig": "Given{}".format(index), "norm": "given{}".format(index)},
+			"familyName": {"orig": "Family{}".format(index), "norm": "family{}".format(index)},
+			"emailAddress": "user{}@example.com".format(index),
+			"metadata": {"createTimestamp": "2026-01-01T10:00:00.000+00:00", "modifyTimestamp": "2026-02-01T10:00:00.000+00:00"},
+			"assignment": [{"@id": offset + 1, "targetRef": {"oid": oid, "type": "c:RoleType", "relation": "org:default"}, "activation": {"effectiveStatus": "enabled"}} for offset, oid in enumerate(role_oids)],
+			"roleMembershipRef": [{"oid": oid, "type": "c:RoleType", "relation": "org:default"} for oid in role_oids]
+		})
+	return json.dumps({"@ns": "http://prism.evolveum.com/xml/ns/public/types-3", "object": {"@type": "http://midpoint.evolveum.com/xml/ns/public/common/api-types-3#ObjectListType", "object": objects}}).encode("utf-8")
+
+
+def make_response(content):
+	response = requests.models.Response()
+	response._content = content
+	response.status_code = 200
+	response.encoding = None
+	response.headers["Content-Type"] = "application/json"
+	return response
+
+
+def previous_decode(content):
+	response = make_response(content)
+	# the trace f-string forced the text decode even with trace disabled
+	"body={}".format(response.text)
+	return response.json()
+
+
+def current_decode(content):
+	return json_loads(make_response(content).content)
+
+
+def measure(logger, label, decode, data, size, rounds):
+	# throughput is always relative to the uncompressed payload size
+	decode(data)
+	start = time.perf_counter()
+	for _round in range(rounds):
+		decode(data)
+	elapsed = (time.perf_counter() - start) / rounds
+	logger.info("{:<22} {:8.3f}s per response  {:8.1f} MiB/s".format(label, elapsed, size / elapsed / 1024 / 1024))
+
+
+def run(logger, users, roles_per_user, rounds):
+	logger.info("{} starting: users={}, roles_per_user={}, rounds={}.".format(os.path.basename(__file__), users, roles_per_user, rounds))
+	content = make_search_payload(users, roles_per_user)
+	compressed = gzip.compress(content, compresslevel=5)
+	logger.info("payload: {:.1f} MiB, gzip: {:.1f} MiB ({:.1%})".format(len(content) / 1024 / 1024, len(compressed) / 1024 / 1024, len(compressed) / len(content)))
+	measure(logger, "previous", previous_decode, content, len(content), rounds)
+	measure(logger, "json_loads ({})".format("orjson" if orjson is not None else "json"), current_decode, content, len(content), rounds)
+	measure(logger, "gunzip+json_loads", lambda data: current_decode(gzip.decompress(data)), compressed, len(content), rounds)
+
+
+if __name__ == "__main__":
+	sys.exit(main())
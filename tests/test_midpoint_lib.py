@@ -0,0 +1,914 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from sherpa.midpoint import midpoint_lib
+from sherpa.midpoint.midpoint_lib import AdmissionController, Midpoint, MidpointClient, MidpointError, ObjectSnapshotStore, ObjectVersionCache, OrgTree, SingleFlight, iter_xml_objects
+
+
+def wait_until(predicate, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met within {} seconds".format(timeout))
+        time.sleep(0.001)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def start_thread(target) -> threading.Thread:
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body, url: str):
+        self.status_code = status_code
+        self.content = b"" if body is None else json.dumps(body).encode()
+        self.url = url
+        self.headers = {}
+
+
+class FakeSession:
+    """Stands in for requests.Session: records each request and answers it with handler(method, path, params, body)."""
+    def __init__(self, handler):
+        self.handler = handler
+        self.headers = {}
+        self.requests = []
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def request(self, method, url, data=None, params=None, headers=None, **kwargs):
+        if data is not None and (headers or {}).get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        body = None if data is None else json.loads(data)
+        path = url.split("/ws/rest", 1)[1]
+        self.requests.append({"method": method, "path": path, "params": params, "body": body, "headers": headers})
+        status_code, response_body = self.handler(method, path, params, body)
+        return FakeResponse(status_code, response_body, url)
+
+
+def make_client(handler, **kwargs) -> MidpointClient:
+    with mock.patch.object(midpoint_lib, "version", return_value="test"), mock.patch.object(midpoint_lib.http, "wait_for_endpoint"):
+        return MidpointClient("http://midpoint", "administrator", "secret", session=FakeSession(handler), **kwargs)
+
+
+class FakeMidpointResponse:
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+        self.raw = io.BytesIO(text.encode())
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeMidpointServer:
+    """Stands in for requests.request in Midpoint: records each call and answers it with handler(method, path, data)."""
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+
+    def request(self, method, url, headers=None, data=None, stream=False):
+        path = url.split("/ws/rest", 1)[1]
+        self.calls.append({"method": method, "path": path, "headers": headers, "data": data})
+        status_code, text = self.handler(method, path, data)
+        return FakeMidpointResponse(status_code, text)
+
+
+def make_midpoint(test_case: unittest.TestCase, handler, **kwargs) -> tuple[Midpoint, FakeMidpointServer]:
+    server = FakeMidpointServer(handler)
+    patcher = mock.patch.object(midpoint_lib.requests, "request", server.request)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    with mock.patch.object(midpoint_lib, "version", return_value="test"), mock.patch.object(midpoint_lib.http, "wait_for_endpoint"):
+        return Midpoint("http://midpoint/ws/rest/", "administrator", "secret", mock.Mock(), **kwargs), server
+
+
+def search_result(objects: list[dict]):
+    return 200, {"object": {"object": objects}}
+
+
+def after_oid(body: dict) -> str:
+    """The oid a keyset page starts after, or None on the first page."""
+    query_filter = body["query"].get("filter") or {}
+    greater = query_filter.get("and", query_filter).get("greater")
+    for clause in midpoint_lib.as_list(greater):
+        if clause["path"] == midpoint_lib.OID_PATH:
+            return clause["value"]
+    return None
+
+
+def xml_search_response(count: int) -> io.BytesIO:
+    objects = "".join(
+        '<apti:object xsi:type="c:UserType" oid="{0}"><c:name>user{0}</c:name><c:assignment><c:targetRef oid="role"/></c:assignment></apti:object>'.format(i)
+        for i in range(count)
+    )
+    return io.BytesIO((
+        '<apti:objectListType xmlns:apti="{}" xmlns:c="http://midpoint.evolveum.com/xml/ns/public/common/common-3" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">{}</apti:objectListType>'
+    ).format(midpoint_lib.API_TYPES_NS, objects).encode())
+
+
+class BuildersTest(unittest.TestCase):
+    def test_item_delta_strips_the_default_prefix(self):
+        self.assertEqual(midpoint_lib.build_item_delta("ADD", "c:assignment/c:targetRef", {"oid": "r1"}), {"modificationType": "add", "path": "assignment/targetRef", "value": [{"oid": "r1"}]})
+
+    def test_item_delta_sends_lists_as_multiple_values(self):
+        self.assertEqual(midpoint_lib.build_item_delta("replace", "description", ["a", "b"])["value"], ["a", "b"])
+        self.assertEqual(midpoint_lib.build_item_delta("replace", "description", [])["value"], [])
+
+    def test_item_delta_without_value_has_no_value(self):
+        self.assertEqual(midpoint_lib.build_item_delta("REPLACE", "description"), {"modificationType": "replace", "path": "description"})
+
+    def test_and_filter_skips_empty_filters(self):
+        equal = {"equal": {"path": "name", "value": "a"}}
+        self.assertIsNone(midpoint_lib.build_and_filter())
+        self.assertIsNone(midpoint_lib.build_and_filter(None, {}))
+        self.assertIs(midpoint_lib.build_and_filter(None, equal, {}), equal)
+
+    def test_and_filter_groups_clauses_of_the_same_kind(self):
+        first = {"equal": {"path": "name", "value": "a"}}
+        second = {"equal": {"path": "description", "value": "b"}}
+        greater = {"greater": {"path": "#", "value": "1"}}
+        self.assertEqual(midpoint_lib.build_and_filter(first, second, greater), {"and": {"equal": [first["equal"], second["equal"]], "greater": greater["greater"]}})
+
+
+class JsonCodecTest(unittest.TestCase):
+    DOCUMENT = {"object": {"name": "Zoë", "values": [1, 2.5, None, True]}}
+
+    def test_falls_back_to_the_json_module_without_orjson(self):
+        with mock.patch.object(midpoint_lib, "orjson", None):
+            data = midpoint_lib.json_dumps_bytes(self.DOCUMENT)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(midpoint_lib.json_loads(data), self.DOCUMENT)
+            self.assertEqual(midpoint_lib.json_loads(data.decode("utf-8")), self.DOCUMENT)
+
+    def test_responses_decode_without_orjson(self):
+        client = make_client(lambda method, path, params, body: (200, {"object": {"oid": "u1", "name": "Zoë"}}))
+        with mock.patch.object(midpoint_lib, "orjson", None):
+            self.assertEqual(client._http_get("/users/u1"), {"object": {"oid": "u1", "name": "Zoë"}})
+
+    def test_large_request_bodies_are_gzipped(self):
+        client = make_client(lambda method, path, params, body: (200, None), compress_requests=True)
+        client._http_patch("/users/u1", {"description": "x" * midpoint_lib.GZIP_MIN_SIZE})
+        client._http_patch("/users/u1", {"description": "x"})
+        self.assertEqual([request["headers"].get("Content-Encoding") for request in client.session.requests], ["gzip", None])
+        self.assertEqual(client.session.requests[0]["body"]["description"], "x" * midpoint_lib.GZIP_MIN_SIZE)
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(midpoint_lib.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rejects_invalid_settings(self):
+        for kwargs in [{"rates": {"bulk": 0}}, {"rates": {"interactive": -1}}, {"rates": {"batch": 5}}, {"burst": 0}]:
+            with self.subTest(kwargs=kwargs):
+                with self.assertRaises(MidpointError):
+                    AdmissionController(**kwargs)
+
+    def test_rejects_unknown_priority(self):
+        with self.assertRaises(MidpointError):
+            AdmissionController().acquire("batch")
+
+    def test_waits_for_a_free_slot(self):
+        controller = AdmissionController(max_concurrency=1)
+        controller.acquire("interactive")
+        waiter = start_thread(lambda: controller.acquire("interactive"))
+        wait_until(lambda: controller.stats()["waiting"]["interactive"] == 1)
+        self.assertEqual(controller.stats()["admitted"], 1)
+        controller.release("interactive", 0.1)
+        waiter.join(5)
+        stats = controller.stats()
+        self.assertEqual((stats["admitted"], stats["throttled"]), (2, 1))
+        self.assertEqual(stats["active"], {"interactive": 1, "bulk": 0})
+
+    def test_caps_bulk_concurrency(self):
+        controller = AdmissionController(max_concurrency=4, bulk_concurrency=1)
+        controller.acquire("bulk")
+        waiter = start_thread(lambda: controller.acquire("bulk"))
+        wait_until(lambda: controller.stats()["waiting"]["bulk"] == 1)
+        controller.acquire("interactive")
+        self.assertEqual(controller.stats()["active"], {"interactive": 1, "bulk": 1})
+        controller.release("bulk", 0.1)
+        waiter.join(5)
+        self.assertEqual(controller.stats()["active"], {"interactive": 1, "bulk": 1})
+
+    def test_free_slot_goes_to_interactive_first(self):
+        controller = AdmissionController(max_concurrency=1)
+        controller.acquire("interactive")
+        bulk = start_thread(lambda: controller.acquire("bulk"))
+        wait_until(lambda: controller.stats()["waiting"]["bulk"] == 1)
+        interactive = start_thread(lambda: controller.acquire("interactive"))
+        wait_until(lambda: controller.stats()["waiting"]["interactive"] == 1)
+        controller.release("interactive", 0.1)
+        interactive.join(5)
+        self.assertEqual(controller.stats()["active"], {"interactive": 1, "bulk": 0})
+        self.assertEqual(controller.stats()["waiting"]["bulk"], 1)
+        controller.release("interactive", 0.1)
+        bulk.join(5)
+        self.assertEqual(controller.stats()["active"], {"interactive": 0, "bulk": 1})
+
+    def test_rate_limits_with_token_bucket(self):
+        controller = AdmissionController(rates={"bulk": 1}, burst=1)
+        controller.acquire("bulk")
+        controller.release("bulk", 0.1)
+        waiter = start_thread(lambda: controller.acquire("bulk"))
+        wait_until(lambda: controller.stats()["waiting"]["bulk"] == 1)
+        # no time has passed, so the bucket is still empty
+        controller.acquire("interactive")
+        controller.release("interactive", 0.1)
+        self.assertEqual(controller.stats()["waiting"]["bulk"], 1)
+        self.clock.now = 1.0
+        controller.acquire("interactive")
+        controller.release("interactive", 0.1)
+        waiter.join(5)
+        stats = controller.stats()
+        self.assertEqual(stats["active"]["bulk"], 1)
+        self.assertEqual(stats["throttled"], 1)
+
+    def test_adaptive_backs_off_and_recovers(self):
+        controller = AdmissionController(bulk_concurrency=4, adaptive=True, latency_target=2.0)
+        self.clock.now = 10.0
+        with controller.admit("bulk") as outcome:
+            outcome["status_code"] = 503
+        self.assertEqual(controller.stats()["bulk_limit"], 2)
+        # a slow response latency_target after the last back-off halves the limit again
+        controller.acquire("bulk")
+        self.clock.now = 13.0
+        controller.release("bulk", 3.0, 200)
+        self.assertEqual(controller.stats()["bulk_limit"], 1)
+        self.assertEqual(controller.stats()["overloaded"], 2)
+        for _ in range(4):
+            with controller.admit("bulk") as outcome:
+                outcome["status_code"] = 200
+        self.assertEqual(controller.stats()["bulk_limit"], 2)
+
+    def test_adaptive_backs_off_once_per_latency_target(self):
+        controller = AdmissionController(bulk_concurrency=4, adaptive=True, latency_target=2.0)
+        self.clock.now = 10.0
+        for _ in range(3):
+            with controller.admit("bulk") as outcome:
+                outcome["status_code"] = 429
+        stats = controller.stats()
+        self.assertEqual((stats["bulk_limit"], stats["overloaded"]), (2, 3))
+
+
+class SingleFlightTest(unittest.TestCase):
+    def run_concurrently(self, single_flight: SingleFlight, call, followers: int = 3) -> list:
+        release = threading.Event()
+        outcomes = []
+
+        def blocked_call():
+            release.wait(5)
+            return call()
+
+        def caller():
+            try:
+                outcomes.append(single_flight.do("key", blocked_call))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [start_thread(caller)]
+        wait_until(lambda: single_flight.stats()["in_flight"] == 1)
+        threads += [start_thread(caller) for _ in range(followers)]
+        wait_until(lambda: single_flight.stats()["coalesced"] == followers)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_coalesces_concurrent_calls(self):
+        single_flight = SingleFlight()
+        calls = []
+        outcomes = self.run_concurrently(single_flight, lambda: calls.append(1) or {"oid": "1"})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [{"oid": "1"}] * 4)
+        # every caller gets an object of its own
+        self.assertEqual(len({id(outcome) for outcome in outcomes}), 4)
+        self.assertEqual(single_flight.stats(), {"executed": 1, "coalesced": 3, "in_flight": 0})
+
+    def test_shares_the_error(self):
+        single_flight = SingleFlight()
+
+        def failing_call():
+            raise MidpointError("boom", 503)
+
+        outcomes = self.run_concurrently(single_flight, failing_call)
+        self.assertEqual(len(outcomes), 4)
+        self.assertTrue(all(isinstance(outcome, MidpointError) and outcome.status_code == 503 for outcome in outcomes))
+        self.assertEqual(single_flight.stats()["in_flight"], 0)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        single_flight = SingleFlight()
+        self.assertEqual(single_flight.do("key", lambda: 1), 1)
+        self.assertEqual(single_flight.do("key", lambda: 2), 2)
+        self.assertEqual(single_flight.stats(), {"executed": 2, "coalesced": 0, "in_flight": 0})
+
+
+class ObjectVersionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(midpoint_lib.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ObjectVersionCache(revalidate_after=10, max_entries=2)
+
+    def test_serves_fresh_entries_until_revalidate_after(self):
+        self.cache.store(("UserType", "1"), "3", {"oid": "1"})
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get_fresh(("UserType", "1")), {"oid": "1"})
+        self.clock.now = 10.0
+        self.assertIsNone(self.cache.get_fresh(("UserType", "1")))
+        self.assertEqual(self.cache.get_version(("UserType", "1")), "3")
+
+    def test_revalidated_entries_are_fresh_again(self):
+        self.cache.store(("UserType", "1"), "3", {"oid": "1"})
+        self.clock.now = 15.0
+        self.assertEqual(self.cache.revalidated(("UserType", "1")), {"oid": "1"})
+        self.clock.now = 24.0
+        self.assertEqual(self.cache.get_fresh(("UserType", "1")), {"oid": "1"})
+        self.assertEqual(self.cache.stats(), {"served": 1, "revalidated": 1, "fetched": 1, "entries": 1})
+
+    def test_evicts_least_recently_used_entries(self):
+        self.cache.store(("UserType", "1"), "1", {"oid": "1"})
+        self.cache.store(("UserType", "2"), "1", {"oid": "2"})
+        self.cache.get_fresh(("UserType", "1"))
+        self.cache.store(("UserType", "3"), "1", {"oid": "3"})
+        self.assertIsNone(self.cache.get_version(("UserType", "2")))
+        self.assertEqual(self.cache.get_version(("UserType", "1")), "1")
+
+    def test_objects_without_version_and_invalidated_ones_are_dropped(self):
+        self.cache.store(("UserType", "1"), "1", {"oid": "1"})
+        self.cache.store(("UserType", "1"), None, {"oid": "1"})
+        self.assertIsNone(self.cache.get_version(("UserType", "1")))
+        self.cache.store(("UserType", "2"), "1", {"oid": "2"})
+        self.cache.invalidate(("UserType", "2"))
+        self.assertIsNone(self.cache.get_fresh(("UserType", "2")))
+
+    def test_bodies_are_copied_in_and_out(self):
+        body = {"oid": "1", "assignment": []}
+        self.cache.store(("UserType", "1"), "1", body)
+        body["assignment"].append("changed")
+        self.cache.get_fresh(("UserType", "1"))["assignment"].append("changed")
+        self.assertEqual(self.cache.get_fresh(("UserType", "1")), {"oid": "1", "assignment": []})
+
+
+class VersionRevalidationTest(unittest.TestCase):
+    def setUp(self):
+        self.objects = {"/users/u1": {"oid": "u1", "name": "one", "version": "1"}, "/resources/r1": {"oid": "r1", "name": "ldap", "version": "1"}}
+        self.client = make_client(self.handle)
+
+    def handle(self, method, path, params, body):
+        if method == "GET":
+            obj = self.objects.get(path)
+            return (200, {"object": obj}) if obj else (404, None)
+        oids = body["query"]["filter"]["inOid"]["value"]
+        endpoint = path.removesuffix("/search")
+        return search_result([{"oid": obj["oid"], "version": obj["version"]} for key, obj in self.objects.items() if key.startswith(endpoint) and obj["oid"] in oids])
+
+    def requests(self) -> list[tuple]:
+        return [(request["method"], request["path"]) for request in self.client.session.requests]
+
+    def test_unchanged_objects_cost_a_projected_search(self):
+        self.client._get_object("UserType", "u1")
+        self.assertEqual(self.client._get_object("UserType", "u1")["name"], "one")
+        self.assertEqual(self.requests(), [("GET", "/users/u1"), ("POST", "/users/search")])
+        self.assertEqual(self.client.session.requests[1]["params"], {"exclude": midpoint_lib.version_check_exclude("UserType")})
+
+    def test_changed_objects_are_downloaded_once(self):
+        self.client._get_object("UserType", "u1")
+        self.objects["/users/u1"] = {"oid": "u1", "name": "renamed", "version": "2"}
+        self.assertEqual(self.client._get_object("UserType", "u1")["name"], "renamed")
+        self.assertEqual(self.requests(), [("GET", "/users/u1"), ("POST", "/users/search"), ("GET", "/users/u1")])
+
+    def test_deleted_objects_are_evicted(self):
+        self.client._get_object("UserType", "u1")
+        del self.objects["/users/u1"]
+        with self.assertRaises(IOError):
+            self.client._get_object("UserType", "u1")
+        self.assertIsNone(self.client._object_cache.get_version(("UserType", "u1")))
+
+    def test_types_without_projection_are_not_cached(self):
+        self.client._get_object("ResourceType", "r1")
+        self.client._get_object("ResourceType", "r1")
+        self.assertEqual(self.requests(), [("GET", "/resources/r1"), ("GET", "/resources/r1")])
+        self.assertEqual(self.client.get_metrics()["object_cache"]["entries"], 0)
+
+
+class ObjectSnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.clock.now = 1000.0
+        patcher = mock.patch.object(midpoint_lib.time, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.roles = {
+            "r1": {"oid": "r1", "name": {"orig": "Admin", "norm": "admin"}, "metadata": {"createTimestamp": "2026-01-01T00:00:00Z"}},
+            "r2": {"oid": "r2", "name": {"orig": "Auditor", "norm": "auditor"}, "metadata": {"createTimestamp": "2026-01-02T00:00:00Z"}},
+        }
+        self.changed = []
+        self.path = os.path.join(tempfile.mkdtemp(), "snapshot.db")
+
+    def handle(self, method, path, params, body):
+        if "paging" not in body["query"]:
+            return search_result([role for role in self.roles.values() if role["name"]["orig"] == body["query"]["filter"]["equal"]["value"]])
+        if body["query"]["paging"].get("orderDirection") == "descending":
+            return search_result([max(self.roles.values(), key=lambda role: role["metadata"]["createTimestamp"])])
+        if body["query"].get("filter") is not None and after_oid(body) is None:
+            return search_result(self.changed)
+        start = after_oid(body)
+        return search_result([role for oid, role in sorted(self.roles.items()) if start is None or oid > start])
+
+    def make_client(self) -> MidpointClient:
+        return make_client(self.handle, snapshot=ObjectSnapshotStore(self.path, max_age={"RoleType": 60}, full_refresh_after=3600))
+
+    def test_refresh_is_due_after_max_age_and_full_after_full_refresh_after(self):
+        store = ObjectSnapshotStore(":memory:", max_age={"RoleType": 60}, full_refresh_after=3600)
+        self.assertEqual(store.get_refresh("RoleType"), {"since": None})
+        store.mark_refreshed("RoleType", "2026-01-02T00:00:00Z", self.clock.now, full=True)
+        self.assertIsNone(store.get_refresh("RoleType"))
+        self.clock.now += 60
+        self.assertEqual(store.get_refresh("RoleType"), {"since": "2026-01-02T00:00:00Z"})
+        self.clock.now += 3600
+        self.assertEqual(store.get_refresh("RoleType"), {"since": None})
+
+    def test_full_refresh_drops_objects_it_did_not_see(self):
+        store = ObjectSnapshotStore(":memory:")
+        store.store("RoleType", list(self.roles.values()), 1.0)
+        store.store("RoleType", [self.roles["r1"]], 2.0)
+        store.mark_refreshed("RoleType", None, 2.0, full=False)
+        self.assertEqual(store.stats()["objects"], {"RoleType": 2})
+        store.mark_refreshed("RoleType", None, 2.0, full=True)
+        self.assertEqual([role["oid"] for role in store.get_all("RoleType")], ["r1"])
+
+    def test_lookups_are_served_from_the_snapshot(self):
+        client = self.make_client()
+        self.assertEqual(client._search_object_by_name("RoleType", "Auditor")["oid"], "r2")
+        requests = len(client.session.requests)
+        self.assertEqual(client._search_object_by_name("RoleType", "Admin")["oid"], "r1")
+        self.assertEqual(len(client.session.requests), requests)
+        self.assertEqual(client.get_metrics()["snapshot"]["hits"], 2)
+
+    def test_incremental_refresh_fetches_changes_since_the_watermark(self):
+        client = self.make_client()
+        client.refresh_snapshot("RoleType")
+        self.clock.now += 60
+        self.changed = [{"oid": "r2", "name": {"orig": "Auditors", "norm": "auditors"}}]
+        self.assertEqual(client._search_object_by_name("RoleType", "Auditors")["oid"], "r2")
+        changes_filter = client.session.requests[-1]["body"]["query"]["filter"]
+        self.assertEqual(changes_filter["or"]["greater"][0]["value"], "2026-01-02T00:00:00Z")
+
+    def test_invalidated_objects_are_read_from_the_server(self):
+        client = self.make_client()
+        client.refresh_snapshot("RoleType")
+        client._invalidate_object("RoleType", "r1")
+        self.assertIsNone(client._snapshot.get("RoleType", "r1"))
+        self.assertEqual(client._search_object_by_name("RoleType", "Admin")["oid"], "r1")
+        self.assertEqual(client.session.requests[-1]["body"]["query"]["filter"], midpoint_lib.build_equal_query("name", "Admin")["query"]["filter"])
+
+    def test_a_new_process_resumes_from_the_stored_snapshot(self):
+        self.make_client().refresh_snapshot("RoleType")
+        client = self.make_client()
+        self.assertEqual(client._search_object_by_name("RoleType", "Admin")["oid"], "r1")
+        self.assertEqual(client.session.requests, [])
+        self.clock.now += 60
+        client._search_object_by_name("RoleType", "Admin")
+        self.assertIn("or", client.session.requests[-1]["body"]["query"]["filter"])
+
+
+class OrgTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.org_tree = OrgTree()
+        self.org_tree.replace([
+            {"oid": "root", "name": {"orig": "Root", "norm": "root"}},
+            {"oid": "sales", "name": "Sales", "parentOrgRef": {"oid": "root"}},
+            {"oid": "it", "name": "IT", "parentOrgRef": [{"oid": "root", "relation": "org:default"}]},
+            {"oid": "shared", "name": "Shared", "parentOrgRef": [{"oid": "sales"}, {"oid": "it"}, {"oid": "board", "relation": "org:manager"}]},
+            {"oid": "team", "name": "Team", "parentOrgRef": {"oid": "shared"}},
+        ])
+
+    def test_ancestors_and_descendants(self):
+        self.assertEqual(self.org_tree.ancestors("team"), ["shared", "sales", "it", "root"])
+        self.assertEqual(self.org_tree.descendants("root"), ["it", "sales", "shared", "team"])
+        self.assertEqual(self.org_tree.descendants("team"), [])
+        self.assertEqual(self.org_tree.ancestors("unknown"), [])
+
+    def test_ignores_non_default_relations(self):
+        self.assertEqual(self.org_tree.get("shared")["parents"], ["sales", "it"])
+        self.assertEqual(self.org_tree.descendants("board"), [])
+
+    def test_path_follows_first_parent(self):
+        self.assertEqual(self.org_tree.path("team"), [
+            {"oid": "root", "name": "Root"},
+            {"oid": "sales", "name": "Sales"},
+            {"oid": "shared", "name": "Shared"},
+            {"oid": "team", "name": "Team"},
+        ])
+
+    def test_in_subtree(self):
+        self.assertTrue(self.org_tree.in_subtree(["team"], "it"))
+        self.assertTrue(self.org_tree.in_subtree(["it"], "it"))
+        self.assertFalse(self.org_tree.in_subtree(["sales"], "it"))
+        self.assertFalse(self.org_tree.in_subtree([], "root"))
+
+    def test_cycles_are_harmless(self):
+        self.org_tree.replace([
+            {"oid": "a", "name": "A", "parentOrgRef": {"oid": "b"}},
+            {"oid": "b", "name": "B", "parentOrgRef": {"oid": "a"}},
+        ])
+        self.assertEqual(self.org_tree.ancestors("a"), ["b"])
+        self.assertEqual(self.org_tree.descendants("a"), ["b"])
+        self.assertEqual(self.org_tree.path("a"), [{"oid": "b", "name": "B"}, {"oid": "a", "name": "A"}])
+
+    def test_update_moves_orgs(self):
+        self.org_tree.update([{"oid": "shared", "name": "Shared", "parentOrgRef": {"oid": "it"}}, {"oid": "hr", "name": "HR", "parentOrgRef": {"oid": "root"}}])
+        self.assertEqual(self.org_tree.ancestors("team"), ["shared", "it", "root"])
+        self.assertEqual(self.org_tree.descendants("sales"), [])
+        self.assertEqual(self.org_tree.descendants("root"), ["hr", "it", "sales", "shared", "team"])
+
+    def test_replace_drops_missing_orgs(self):
+        self.org_tree.replace([{"oid": "root", "name": "Root"}])
+        self.assertIsNone(self.org_tree.get("team"))
+        self.assertEqual(self.org_tree.descendants("root"), [])
+        self.assertEqual(self.org_tree.stats()["orgs"], 1)
+
+    def test_get_returns_a_copy(self):
+        self.org_tree.get("shared")["parents"].append("root")
+        self.assertEqual(self.org_tree.get("shared")["parents"], ["sales", "it"])
+
+
+class OrgHierarchyLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.orgs = {
+            "1": {"oid": "1", "name": "Root", "metadata": {"createTimestamp": "2026-01-01T00:00:00Z"}},
+            "2": {"oid": "2", "name": "Sales", "parentOrgRef": {"oid": "1"}, "metadata": {"createTimestamp": "2026-01-02T00:00:00Z"}},
+            "3": {"oid": "3", "name": "Team", "parentOrgRef": {"oid": "2"}, "metadata": {"createTimestamp": "2026-01-03T00:00:00Z"}},
+        }
+        self.changed = []
+        self.client = make_client(self.handle, org_tree_refresh_after=0)
+
+    def handle(self, method, path, params, body):
+        paging = body["query"]["paging"]
+        if paging.get("orderDirection") == "descending":
+            latest = max(self.orgs.values(), key=lambda org: org["metadata"]["createTimestamp"])
+            return search_result([latest])
+        if "or" in json.dumps(body["query"].get("filter")):
+            return search_result(self.changed)
+        start = after_oid(body)
+        return search_result([org for oid, org in sorted(self.orgs.items()) if start is None or oid > start][:paging["maxSize"]])
+
+    def org_searches(self):
+        return [request for request in self.client.session.requests if request["body"]["query"]["paging"].get("orderDirection") != "descending"]
+
+    def test_loads_in_pages_without_bulky_items(self):
+        org_tree = self.client.refresh_org_tree(full=True, page_size=2)
+        self.assertEqual(org_tree.ancestors("3"), ["2", "1"])
+        searches = self.org_searches()
+        self.assertEqual(len(searches), 2)
+        self.assertTrue(all(request["params"]["exclude"] == midpoint_lib.ORG_TREE_EXCLUDE for request in searches))
+        self.assertEqual(self.client.get_metrics()["org_tree"], {"orgs": 3, "watermark": "2026-01-03T00:00:00Z"})
+
+    def test_refreshes_incrementally_after_the_watermark(self):
+        self.client.refresh_org_tree(full=True)
+        self.changed = [{"oid": "3", "name": "Team", "parentOrgRef": {"oid": "1"}}]
+        self.assertEqual([org["oid"] for org in self.client.get_org_descendants("1")], ["2", "3"])
+        self.assertEqual([org["oid"] for org in self.client.get_org_ancestors("3")], ["1"])
+        incremental = self.org_searches()[-1]["body"]["query"]["filter"]
+        self.assertEqual(incremental["or"]["greater"][0]["value"], "2026-01-03T00:00:00Z")
+
+    def test_views_share_the_clients_hierarchy(self):
+        client = make_client(self.handle)
+        client.get_org_tree()
+        view = client.for_principal("other")
+        self.assertIs(view.get_org_tree(), client.get_org_tree())
+        self.assertTrue(all(request["headers"]["Switch-To-Principal"] is None for request in client.session.requests))
+
+    def test_full_load_reads_the_snapshot_when_one_covers_orgs(self):
+        snapshot = ObjectSnapshotStore(":memory:")
+        client = make_client(self.handle, snapshot=snapshot)
+        client.refresh_snapshot("OrgType")
+        searches = len(client.session.requests)
+        client.refresh_org_tree(full=True)
+        self.assertEqual(len(client.session.requests), searches)
+        self.assertEqual(client.get_org_tree().descendants("1"), ["2", "3"])
+
+
+class NormalizationTest(unittest.TestCase):
+    ROLE = {"oid": "r1", "name": {"orig": "Role 1", "norm": "role 1"}}
+
+    def raw_user(self, oid: str) -> dict:
+        return {
+            "@type": "c:UserType",
+            "oid": oid,
+            "name": {"orig": "user" + oid, "norm": "user" + oid},
+            "assignment": [
+                {"targetRef": {"type": "c:RoleType", "oid": "r1", "relation": "org:default"}, "activation": {"effectiveStatus": "enabled"}},
+                {"targetRef": {"type": "c:RoleType", "oid": "r2", "relation": "org:default"}, "activation": {"effectiveStatus": "disabled"}},
+            ],
+            "roleMembershipRef": {"type": "c:RoleType", "oid": "r1", "relation": "org:default"},
+        }
+
+    def test_normalizes_with_resolved_references_only(self):
+        raw_user = self.raw_user("u1")
+        self.assertEqual(midpoint_lib.collect_references(raw_user), [raw_user["assignment"][0]["targetRef"], raw_user["roleMembershipRef"]])
+        normalized_user = midpoint_lib.normalize_object(raw_user, {("RoleType", "r1"): self.ROLE})
+        self.assertEqual(normalized_user["role_assignment"], [{"type": "Role", "oid": "r1", "relation": "org:default", "name": self.ROLE["name"]}])
+        self.assertEqual(normalized_user["role_membership"], [{"type": "Role", "oid": "r1", "name": self.ROLE["name"], "relation": "org:default"}])
+
+    def test_discards_parent_cases(self):
+        raw_cases = [
+            {"@type": "c:CaseType", "oid": "c1", "name": {"orig": "Parent"}, "requestorRef": {"type": "c:UserType", "oid": "u1"}},
+            {"@type": "c:CaseType", "oid": "c2", "name": {"orig": "Child"}, "workItem": {"@id": 3, "name": {"orig": "Approve"}, "assigneeRef": {"type": "c:UserType", "oid": "u2"}}},
+        ]
+        self.assertEqual(midpoint_lib.collect_references(raw_cases[0]), [])
+        normalized_cases = midpoint_lib.normalize_objects(raw_cases, {("UserType", "u2"): {"name": {"orig": "approver"}}})
+        self.assertEqual([case["name"] for case in normalized_cases], ["Child"])
+        self.assertEqual(normalized_cases[0]["workitems"], [{"id": 3, "name": "Approve", "assignee": {"type": "User", "oid": "u2", "name": {"orig": "approver"}}}])
+
+    def test_extract_display_name(self):
+        self.assertEqual(midpoint_lib.extract_display_name({"orig": "A", "norm": "a"}), "A")
+        self.assertEqual(midpoint_lib.extract_display_name({"oid": "1", "targetName": {"orig": "B"}}), "B")
+        self.assertEqual(midpoint_lib.extract_display_name("C"), "C")
+        self.assertEqual(midpoint_lib.extract_display_name(None), "")
+
+    def test_export_normalizes_pages_in_a_process_pool(self):
+        raw_users = [self.raw_user("u{}".format(i)) for i in range(1, 6)]
+
+        def handle(method, path, params, body):
+            if method == "GET":
+                return 200, {"role": dict(self.ROLE, version="1")}
+            return search_result(raw_users if after_oid(body) is None else [])
+
+        outputs = []
+        for processes in [None, 2]:
+            output = io.StringIO()
+            make_client(handle).export_users(output, processes=processes)
+            outputs.append(output.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(len(outputs[1].splitlines()), 5)
+
+
+class GetUsersTest(unittest.TestCase):
+    USERS = [{"oid": "u1", "name": "alice"}, {"oid": "u2", "name": "bob"}, {"oid": "u3", "name": "carol"}]
+
+    def setUp(self):
+        self.client = make_client(self.handle)
+
+    def handle(self, method, path, params, body):
+        query_filter = body["query"]["filter"]
+        if "inOid" in query_filter:
+            return search_result([user for user in self.USERS if user["oid"] in query_filter["inOid"]["value"]])
+        names = [clause["value"] for clause in query_filter["or"]["equal"]]
+        return search_result([user for user in self.USERS if user["name"] in names])
+
+    def test_results_follow_the_requested_order(self):
+        users = self.client.get_users(oids=["u3", "u1", "u3"])
+        self.assertEqual([user["oid"] for user in users], ["u3", "u1", "u3"])
+        self.assertEqual(self.client.session.requests[0]["body"]["query"]["filter"], {"inOid": {"value": ["u3", "u1"]}})
+
+    def test_missing_entries_are_marked_not_found(self):
+        self.assertEqual(self.client.get_users(oids=["u1", "gone"])[1], {"status": "not_found", "oid": "gone"})
+        self.assertEqual(self.client.get_users(names=["dave", "bob"])[0], {"status": "not_found", "name": "dave"})
+
+    def test_names_are_looked_up_in_chunks(self):
+        users = self.client.get_users(names=["carol", "alice", "bob"], chunk_size=2)
+        self.assertEqual([user["oid"] for user in users], ["u3", "u1", "u2"])
+        self.assertEqual(len(self.client.session.requests), 2)
+
+    def test_requires_either_oids_or_names(self):
+        with self.assertRaises(Exception):
+            self.client.get_users()
+        with self.assertRaises(Exception):
+            self.client.get_users(oids=["u1"], names=["alice"])
+
+
+class ObjectPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.cases = [{"oid": "c{}".format(i), "name": {"orig": "Case {}".format(i)}} for i in range(1, 6)]
+        self.client = make_client(self.handle)
+
+    def handle(self, method, path, params, body):
+        query_filter = body["query"].get("filter") or {}
+        start = None
+        if "text" in query_filter and " and # > " in query_filter["text"]:
+            start = query_filter["text"].rsplit('"', 2)[1]
+        elif query_filter:
+            start = after_oid(body)
+        return search_result([case for case in self.cases if start is None or case["oid"] > start][:body["query"]["paging"]["maxSize"]])
+
+    def filters(self) -> list[dict]:
+        return [request["body"]["query"].get("filter") for request in self.client.session.requests]
+
+    def test_text_filter_pages_extend_the_query_text(self):
+        query_filter = {"text": 'state = "open" or state = "created"'}
+        self.assertEqual(self.client._count_objects("CaseType", query_filter, page_size=2), 5)
+        self.assertEqual(self.filters(), [
+            query_filter,
+            {"text": '(state = "open" or state = "created") and # > "c2"'},
+            {"text": '(state = "open" or state = "created") and # > "c4"'},
+        ])
+
+    def test_json_filter_pages_are_combined_with_and(self):
+        query_filter = {"equal": {"path": "state", "value": "open"}}
+        pages = list(self.client.iter_object_pages("CaseType", query_filter=query_filter, page_size=3))
+        self.assertEqual([[case["oid"] for case in page] for page, _checkpoint in pages], [["c1", "c2", "c3"], ["c4", "c5"]])
+        self.assertEqual(pages[-1][1], {"offset": 5, "oid": "c5"})
+        self.assertEqual(self.filters()[1], {"and": {"equal": query_filter["equal"], "greater": {"path": "#", "value": "c3"}}})
+
+    def test_unfiltered_pages_filter_on_the_oid_only(self):
+        pages = list(self.client.iter_object_pages("CaseType", page_size=4))
+        self.assertEqual(sum(len(page) for page, _checkpoint in pages), 5)
+        self.assertEqual(self.filters(), [None, {"greater": {"path": "#", "value": "c4"}}])
+
+    def test_resumes_from_a_checkpoint(self):
+        pages = list(self.client.iter_object_pages("CaseType", query_filter={"text": 'state = "open"'}, page_size=10, checkpoint={"offset": 3, "oid": "c3"}))
+        self.assertEqual([case["oid"] for case in pages[0][0]], ["c4", "c5"])
+        self.assertEqual(pages[0][1], {"offset": 5, "oid": "c5"})
+
+
+class RequestedCasesTest(unittest.TestCase):
+    def test_listing_and_count_filter_parent_cases_on_the_server(self):
+        case = {"oid": "c1", "name": {"orig": "Case 1"}, "state": "open", "workItem": {"@id": 1}}
+        client = make_client(lambda method, path, params, body: search_result([case]))
+        self.assertEqual([case["oid"] for case in client.get_requested_cases("u1", offset=0, limit=10)], ["c1"])
+        self.assertEqual(client.count_requested_cases("u1"), 1)
+        listing, count = [request["body"]["query"]["filter"] for request in client.session.requests]
+        self.assertEqual(listing, count)
+        self.assertTrue(listing["text"].endswith("and workItem exists"))
+
+
+class SystemConfigurationTest(unittest.TestCase):
+    SYSTEM_CONFIGURATION = """<systemConfiguration xmlns="http://midpoint.evolveum.com/xml/ns/public/common/common-3" oid="00000000-0000-0000-0000-000000000001" version="3">
+        <adminGuiConfiguration><objectCollectionViews>{}</objectCollectionViews></adminGuiConfiguration>
+    </systemConfiguration>"""
+
+    def make(self, views: list[str]):
+        view_elements = "".join("<objectCollectionView><identifier>{}</identifier></objectCollectionView>".format(view) for view in views)
+        system_configuration = self.SYSTEM_CONFIGURATION.format(view_elements)
+        return make_midpoint(self, lambda method, path, data: (200, system_configuration) if method == "GET" else (204, ""))
+
+    def patches(self, server) -> list[dict]:
+        return [call for call in server.calls if call["method"] == "PATCH"]
+
+    def test_deleting_the_last_view_replaces_without_value(self):
+        midpoint, server = self.make(["all-users"])
+        midpoint.delete_object_collection_view("all-users")
+        patch = self.patches(server)[0]
+        self.assertEqual(patch["headers"]["Content-Type"], "application/json")
+        self.assertEqual(json.loads(patch["data"]), {"objectModification": {"itemDelta": [{"modificationType": "replace", "path": "adminGuiConfiguration/objectCollectionViews"}]}})
+
+    def test_deleting_a_view_keeps_the_others_as_xml(self):
+        midpoint, server = self.make(["all-users", "all-roles"])
+        midpoint.delete_object_collection_view("all-users")
+        patch = self.patches(server)[0]
+        self.assertEqual(patch["headers"]["Content-Type"], "application/xml")
+        self.assertIn("all-roles", patch["data"])
+        self.assertNotIn("all-users", patch["data"])
+
+    def test_plain_strings_are_sent_as_json(self):
+        midpoint, server = self.make([])
+        midpoint.set_system_configuration("replace", "c:deploymentInformation/c:name", "<Identicum>")
+        self.assertEqual(json.loads(self.patches(server)[0]["data"])["objectModification"]["itemDelta"][0]["value"], ["<Identicum>"])
+
+    def test_rejects_unknown_value_format(self):
+        midpoint, server = self.make([])
+        with self.assertRaises(Exception):
+            midpoint.set_system_configuration("replace", "c:deploymentInformation/c:name", "x", value_format="yaml")
+        self.assertEqual(server.calls, [])
+
+
+class PipelinedImportTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for folder, name, content in [
+            ("010_roles", "r1.xml", '<role xmlns="http://midpoint.evolveum.com/xml/ns/public/common/common-3" oid="r1"><name>Admin</name></role>'),
+            ("020_users", "u2.xml", '<user xmlns="http://midpoint.evolveum.com/xml/ns/public/common/common-3" oid="u2"><name>bob</name></user>'),
+            ("020_users", "u1.xml", '<user xmlns="http://midpoint.evolveum.com/xml/ns/public/common/common-3" oid="u1"><name>alice</name></user>'),
+        ]:
+            os.makedirs(os.path.join(self.root, "import", folder), exist_ok=True)
+            with open(os.path.join(self.root, "import", folder, name), "w") as f:
+                f.write(content)
+
+    def import_calls(self, pipelined: bool, **kwargs) -> list[tuple]:
+        midpoint, server = make_midpoint(self, lambda method, path, data: (201, ""), temp_file_path=os.path.join(self.root, "object"), **kwargs)
+        if pipelined:
+            midpoint.process_subfolders_pipelined(os.path.join(self.root, "import"), queue_depth=1)
+        else:
+            midpoint.process_subfolders(os.path.join(self.root, "import"))
+        return [(call["method"], call["path"]) for call in server.calls]
+
+    def test_uploads_keep_folder_and_file_order(self):
+        calls = self.import_calls(pipelined=True)
+        self.assertEqual(calls, [("PUT", "/roles/r1"), ("PUT", "/users/u1"), ("PUT", "/users/u2")])
+        self.assertEqual(calls, self.import_calls(pipelined=False))
+
+    def test_files_prepared_before_a_failure_are_uploaded(self):
+        os.makedirs(os.path.join(self.root, "import", "030_broken"))
+        with open(os.path.join(self.root, "import", "030_broken", "broken.json"), "w") as f:
+            f.write("{")
+        midpoint, server = make_midpoint(self, lambda method, path, data: (201, ""), temp_file_path=os.path.join(self.root, "object"))
+        with self.assertRaises(ValueError):
+            midpoint.process_subfolders_pipelined(os.path.join(self.root, "import"))
+        self.assertEqual(len(server.calls), 3)
+
+    def test_profile_counts_files_per_folder(self):
+        midpoint, _server = make_midpoint(self, lambda method, path, data: (201, ""), temp_file_path=os.path.join(self.root, "object"), profile=True)
+        midpoint.process_subfolders_pipelined(os.path.join(self.root, "import"))
+        profile = midpoint.get_import_profile()
+        self.assertEqual({folder: entry["files"] for folder, entry in profile["by_folder"].items()}, {"010_roles": 1, "020_users": 2})
+        self.assertEqual([row["object_class"] for row in profile["rows"]], ["role", "user"])
+
+    def test_profile_is_exported_when_the_import_finishes(self):
+        profile_file = os.path.join(self.root, "profile.json")
+        midpoint, _server = make_midpoint(self, lambda method, path, data: (201, ""), temp_file_path=os.path.join(self.root, "object"), profile=True, profile_file=profile_file)
+        midpoint.process_subfolders(os.path.join(self.root, "import"))
+        with open(profile_file) as f:
+            self.assertEqual(json.load(f)["by_folder"]["020_users"]["files"], 2)
+
+    def test_admission_wait_is_profiled_apart_from_http(self):
+        admission = AdmissionController(bulk_concurrency=1)
+        admission.acquire("bulk")
+        midpoint, server = make_midpoint(self, lambda method, path, data: (201, ""), temp_file_path=os.path.join(self.root, "object"), profile=True, admission=admission)
+        thread = start_thread(lambda: midpoint.process_subfolders(os.path.join(self.root, "import")))
+        wait_until(lambda: admission.stats()["waiting"]["bulk"] == 1)
+        time.sleep(0.05)
+        admission.release("bulk", 0.0)
+        thread.join(timeout=5)
+        roles = midpoint.get_import_profile()["by_folder"]["010_roles"]
+        self.assertGreaterEqual(roles["admission"], 0.05)
+        self.assertLess(roles["http"], 0.05)
+        self.assertEqual(len(server.calls), 3)
+
+
+class IterXmlObjectsTest(unittest.TestCase):
+    def test_yields_each_object(self):
+        names = [element.findtext("{http://midpoint.evolveum.com/xml/ns/public/common/common-3}name") for element in iter_xml_objects(xml_search_response(3))]
+        self.assertEqual(names, ["user0", "user1", "user2"])
+
+    def test_clears_consumed_objects(self):
+        retained = []
+        oids = []
+        for element in iter_xml_objects(xml_search_response(5)):
+            oids.append(element.get("oid"))
+            # the previous object was cleared when this one was requested
+            self.assertEqual([len(previous) for previous in retained], [0] * len(retained))
+            retained.append(element)
+        self.assertEqual(oids, ["0", "1", "2", "3", "4"])
+        self.assertEqual(len(retained[-1]), 0)
+
+    def test_empty_response(self):
+        self.assertEqual(list(iter_xml_objects(xml_search_response(0))), [])
+
+
+class StreamedAdmissionTest(unittest.TestCase):
+    def setUp(self):
+        self.admission = AdmissionController(bulk_concurrency=1)
+        search_response = xml_search_response(2).read().decode()
+        self.status_code = 200
+        self.midpoint, self.server = make_midpoint(self, lambda method, path, data: (self.status_code, search_response), admission=self.admission)
+
+    def active(self) -> int:
+        return self.admission.stats()["active"]["bulk"]
+
+    def test_slot_is_held_until_the_stream_is_consumed(self):
+        objects = self.midpoint.iter_search_objects("UserType", "<query/>")
+        next(objects)
+        self.assertEqual(self.active(), 1)
+        self.assertEqual(len(list(objects)), 1)
+        self.assertEqual(self.active(), 0)
+
+    def test_slot_is_freed_when_the_stream_is_abandoned(self):
+        objects = self.midpoint.iter_search_objects("UserType", "<query/>")
+        next(objects)
+        objects.close()
+        self.assertEqual(self.active(), 0)
+        self.assertEqual(self.admission.stats()["admitted"], 1)
+
+    def test_slot_is_freed_on_error_responses(self):
+        self.status_code = 503
+        with self.assertRaises(IOError):
+            next(self.midpoint.iter_search_objects("UserType", "<query/>"))
+        self.assertEqual(self.active(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()